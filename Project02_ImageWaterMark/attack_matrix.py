@@ -0,0 +1,121 @@
+import os
+import csv
+import zlib
+import cv2
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+from watermarking import WatermarkingSystem
+from robustness_tests import ATTACKS, STOCHASTIC_ATTACKS
+from result_cache import ResultCache, make_cache_key
+
+RESULT_FIELDS = ('image', 'attack', 'param', 'ncc', 'error')
+
+
+class AttackResult(NamedTuple):
+    """攻击矩阵中的一个单元：某幅图像在某种攻击、某个参数下的NCC"""
+    image: str
+    attack: str
+    param: float
+    ncc: Optional[float] = None
+    error: Optional[str] = None
+
+
+# 工作进程内缓存最近加载的图像与密钥，同一图像的多个任务无需重复解码
+_loaded: Optional[Tuple[str, str, np.ndarray, WatermarkingSystem]] = None
+_cache: Optional[ResultCache] = None
+
+
+def _init_worker(cache_dir: Optional[str], cache_max_bytes: int) -> None:
+    global _cache
+    cv2.setNumThreads(1)    # 并行度由进程数决定
+    if cache_dir:
+        _cache = ResultCache(cache_dir, cache_max_bytes)
+
+
+def _load(image_path: str, key_path: str) -> Tuple[np.ndarray, WatermarkingSystem]:
+    global _loaded
+    if _loaded is None or _loaded[:2] != (image_path, key_path):
+        image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+        if image is None:
+            raise FileNotFoundError(f"无法读取图像文件 {image_path}")
+        system = WatermarkingSystem()
+        system.load_key(key_path)
+        system.cache = _cache
+        _loaded = (image_path, key_path, image, system)
+    return _loaded[2], _loaded[3]
+
+
+# 执行一组单元：每个攻击图像只计算一次，可选保存到 save_dir
+def _run_cells(image_path: str, key_path: str, attack_name: str, params: Sequence[float],
+               seed: int, save_dir: Optional[str]) -> List[AttackResult]:
+    results = []
+    try:
+        image, system = _load(image_path, key_path)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        return [AttackResult(image_path, attack_name, param, error=error) for param in params]
+
+    for param in params:
+        try:
+            # 含随机性的攻击（如噪声）按单元确定性播种，结果与调度方式无关
+            cell = f"{os.path.basename(image_path)}|{attack_name}|{param}".encode()
+            cell_seed = (seed ^ zlib.crc32(cell)) & 0xFFFFFFFF
+            np.random.seed(cell_seed)
+            if _cache is None:
+                attacked_image = ATTACKS[attack_name](image, param)
+            else:
+                # 随机攻击的缓存键使用实际播种的单元种子：内容相同、文件名不同的图像各自采样；
+                # 确定性攻击与 RobustnessTester.run_attack 使用相同的键，两者可共用缓存
+                if attack_name in STOCHASTIC_ATTACKS:
+                    key = make_cache_key('attack', attack_name, param, cell_seed, image)
+                else:
+                    key = make_cache_key('attack', attack_name, param, image)
+                attacked_image = _cache.get_or_compute(key, lambda: ATTACKS[attack_name](image, param))
+            if save_dir:
+                stem = os.path.splitext(os.path.basename(image_path))[0]
+                cv2.imwrite(os.path.join(save_dir, f"{stem}_{attack_name}_{param}.png"), attacked_image)
+            extracted_watermark = system.extract(attacked_image)
+            ncc = system.calculate_ncc(system.watermark, extracted_watermark)
+            results.append(AttackResult(image_path, attack_name, param, float(ncc)))
+        except Exception as e:
+            results.append(AttackResult(image_path, attack_name, param, error=f"{type(e).__name__}: {e}"))
+    return results
+
+
+# 运行攻击矩阵：images 为 (带水印图像路径, 提取密钥路径) 列表，attacks 为 {攻击类型: 参数序列}
+# 单元按 chunk_size 分组分发到进程池，返回按 图像 × 攻击 × 参数 顺序排列的结果
+# 指定 cache_dir 时，攻击图像和提取结果按内容哈希缓存，参数未变的单元再次运行时直接复用
+def run_attack_matrix(images: Sequence[Tuple[str, str]], attacks: Dict[str, Iterable[float]],
+                      workers: Optional[int] = None, chunk_size: int = 8, seed: int = 42,
+                      save_dir: Optional[str] = None, cache_dir: Optional[str] = None,
+                      cache_max_bytes: int = 1 << 30) -> List[AttackResult]:
+    for attack_name in attacks:
+        if attack_name not in ATTACKS:
+            raise ValueError(f"未知的攻击类型 {attack_name}")
+    if save_dir:
+        os.makedirs(save_dir, exist_ok=True)
+
+    tasks = []
+    for image_path, key_path in images:
+        for attack_name, params in attacks.items():
+            params = list(params)
+            for start in range(0, len(params), chunk_size):
+                tasks.append((image_path, key_path, attack_name, params[start:start + chunk_size], seed, save_dir))
+
+    results: List[Optional[List[AttackResult]]] = [None] * len(tasks)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(cache_dir, cache_max_bytes)) as pool:
+        futures = {pool.submit(_run_cells, *task): index for index, task in enumerate(tasks)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+    return [result for chunk in results for result in chunk]
+
+
+# 将结果写为整洁的长表CSV，每行一个单元
+def write_results_csv(results: Iterable[AttackResult], csv_path: str) -> None:
+    with open(csv_path, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(RESULT_FIELDS)
+        for result in results:
+            writer.writerow(['' if value is None else value for value in result])
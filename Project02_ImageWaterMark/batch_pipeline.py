@@ -0,0 +1,167 @@
+import os
+import zlib
+import argparse
+import cv2
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterable, Iterator, NamedTuple, Optional, Union
+from watermarking import WatermarkingSystem
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.webp')
+
+
+class PipelineResult(NamedTuple):
+    """单个文件的处理结果：error 非空表示该文件失败，其余文件不受影响"""
+    path: str
+    output_path: Optional[str] = None
+    ncc: Optional[float] = None
+    error: Optional[str] = None
+
+
+# 列出待处理的图像：source 可以是目录，也可以是文件路径列表
+def iter_image_files(source: Union[str, Iterable[str]]) -> Iterator[str]:
+    if isinstance(source, str):
+        for name in sorted(os.listdir(source)):
+            path = os.path.join(source, name)
+            if os.path.isfile(path) and name.lower().endswith(IMAGE_EXTENSIONS):
+                yield path
+    else:
+        yield from source
+
+
+# 每个工作进程持有一个水印系统实例，由进程池初始化时创建一次
+_worker_system: Optional[WatermarkingSystem] = None
+
+
+def _init_worker(alpha: float, seed: int, watermark_image_path: Optional[str]) -> None:
+    global _worker_system
+    cv2.setNumThreads(1)    # 并行度由进程数决定，避免OpenCV线程与进程相互争抢
+    _worker_system = WatermarkingSystem(alpha=alpha, seed=seed, watermark_image_path=watermark_image_path)
+
+
+def _embed_file(path: str, output_path: str, key_path: str) -> PipelineResult:
+    try:
+        # 随机水印的种子由文件名决定，结果与调度顺序和进程数无关
+        np.random.seed((_worker_system.seed ^ zlib.crc32(os.path.basename(path).encode())) & 0xFFFFFFFF)
+        _worker_system.embed(path, output_path)
+        _worker_system.save_key(key_path)
+        return PipelineResult(path, output_path)
+    except Exception as e:
+        return PipelineResult(path, error=f"{type(e).__name__}: {e}")
+
+
+def _verify_file(path: str, key_path: str) -> PipelineResult:
+    try:
+        image = cv2.imread(path, cv2.IMREAD_COLOR)
+        if image is None:
+            raise FileNotFoundError(f"无法读取图像文件 {path}")
+        _worker_system.load_key(key_path)
+        extracted_watermark = _worker_system.extract(image)
+        ncc = _worker_system.calculate_ncc(_worker_system.watermark, extracted_watermark)
+        return PipelineResult(path, ncc=float(ncc))
+    except Exception as e:
+        return PipelineResult(path, error=f"{type(e).__name__}: {e}")
+
+
+def _reject_file(path: str, error: str) -> PipelineResult:
+    return PipelineResult(path, error=error)
+
+
+# 输出与密钥保留源文件的完整文件名（含扩展名），a.png 与 a.jpg 不会互相覆盖：
+# a.jpg 的输出为 a.jpg.png，密钥为 a.jpg.npz；验证 a.jpg.png 时去掉输出扩展名即得到密钥名
+def _key_path(key_dir: str, name: str) -> str:
+    return os.path.join(key_dir, name + '.npz')
+
+
+# 以有界的在途任务数将任务流式提交到进程池，按完成顺序产出结果
+def _run(tasks: Iterator[tuple], workers: Optional[int], max_pending: Optional[int],
+         initargs: tuple) -> Iterator[PipelineResult]:
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 4
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+        pending = set()
+        for func, *args in tasks:
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(pool.submit(func, *args))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+# 批量嵌入：每个文件依次完成解码、YCrCb转换、DCT嵌入与编码，输出图像与提取密钥分别写入 output_dir 和 key_dir
+def embed_directory(source: Union[str, Iterable[str]], output_dir: str, key_dir: Optional[str] = None,
+                    alpha: float = 0.1, seed: int = 42, watermark_image_path: Optional[str] = None,
+                    workers: Optional[int] = None, max_pending: Optional[int] = None,
+                    output_ext: str = '.png') -> Iterator[PipelineResult]:
+    key_dir = key_dir or output_dir
+    os.makedirs(output_dir, exist_ok=True)
+    os.makedirs(key_dir, exist_ok=True)
+
+    def tasks():
+        sources = {}
+        for path in iter_image_files(source):
+            name = os.path.basename(path)
+            if name in sources:
+                # 来自不同目录的同名文件会写到同一个输出和密钥，拒绝后者
+                yield _reject_file, path, f"文件名与 {sources[name]} 重复，输出和密钥会互相覆盖"
+                continue
+            sources[name] = path
+            yield _embed_file, path, os.path.join(output_dir, name + output_ext), _key_path(key_dir, name)
+
+    return _run(tasks(), workers, max_pending, (alpha, seed, watermark_image_path))
+
+
+# 批量验证：按文件名（去掉输出扩展名）查找 key_dir 中对应的密钥，提取水印并计算NCC
+def verify_directory(source: Union[str, Iterable[str]], key_dir: str,
+                     workers: Optional[int] = None, max_pending: Optional[int] = None) -> Iterator[PipelineResult]:
+    def tasks():
+        for path in iter_image_files(source):
+            yield _verify_file, path, _key_path(key_dir, os.path.splitext(os.path.basename(path))[0])
+
+    return _run(tasks(), workers, max_pending, (0.1, 42, None))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量嵌入/验证图像水印")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    embed_parser = subparsers.add_parser('embed', help="批量嵌入水印")
+    embed_parser.add_argument('source', help="输入图像目录")
+    embed_parser.add_argument('output_dir', help="水印图像输出目录")
+    embed_parser.add_argument('--key-dir', help="提取密钥输出目录（默认与输出目录相同）")
+    embed_parser.add_argument('--alpha', type=float, default=0.1)
+    embed_parser.add_argument('--seed', type=int, default=42)
+    embed_parser.add_argument('--watermark', help="自定义水印图像路径")
+    embed_parser.add_argument('--workers', type=int)
+
+    verify_parser = subparsers.add_parser('verify', help="批量提取水印并计算NCC")
+    verify_parser.add_argument('source', help="待验证图像目录")
+    verify_parser.add_argument('key_dir', help="提取密钥目录")
+    verify_parser.add_argument('--workers', type=int)
+
+    args = parser.parse_args()
+    if args.command == 'embed':
+        results = embed_directory(args.source, args.output_dir, args.key_dir, args.alpha, args.seed,
+                                  args.watermark, args.workers)
+    else:
+        results = verify_directory(args.source, args.key_dir, args.workers)
+
+    failed = 0
+    for result in results:
+        if result.error:
+            failed += 1
+            print(f"{result.path}: 失败 {result.error}")
+        elif result.ncc is not None:
+            print(f"{result.path}: NCC {result.ncc:.4f}")
+        else:
+            print(f"{result.path} -> {result.output_path}")
+    if failed:
+        print(f"共 {failed} 个文件处理失败")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import cv2
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List
+from watermarking import WatermarkingSystem
+from fast_watermarking import FastWatermarker
+from robustness_tests import RobustnessTester
+
+try:
+    import resource
+except ImportError:     # Windows 下没有 resource 模块
+    resource = None
+
+# 测试分辨率：(名称, 高, 宽)
+RESOLUTIONS = [
+    ('512x512', 512, 512),
+    ('1024x1024', 1024, 1024),
+    ('1080p', 1080, 1920),
+    ('4K', 2160, 3840),
+    ('8K', 4320, 7680),
+]
+
+# 每种攻击使用的参数，与 main.py 中的测试一致
+ATTACK_PARAMS = {
+    'rotation': 30,
+    'scaling': 0.8,
+    'cropping': 0.8,
+    'brightness': 50,
+    'contrast': 1.5,
+    'noise': 20,
+    'jpeg_compression': 70,
+}
+
+
+# 生成合成测试图像：低分辨率随机噪声放大后得到平滑纹理，再叠加少量细节噪声
+def synthetic_image(height: int, width: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    coarse = rng.random((max(height // 32, 2), max(width // 32, 2), 3)) * 255
+    image = cv2.resize(coarse.astype(np.float32), (width, height), interpolation=cv2.INTER_CUBIC)
+    image += rng.normal(0, 8, image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+# 峰值RSS：Linux 下可通过 /proc/self/clear_refs 重置并读取 VmHWM，从而得到单个阶段的峰值
+def _reset_peak_rss() -> bool:
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # 其他平台退回进程生命周期内的峰值（Linux以KB计，macOS以字节计）
+    if resource is None:
+        return float('nan')
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _measure(stage: str, func: Callable[[], object], repeats: int) -> Dict[str, object]:
+    func()      # 预热：计划缓存、OpenCV内部初始化等不计入
+    _reset_peak_rss()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    mean = sum(times) / len(times)
+    return {
+        'stage': stage,
+        'repeats': repeats,
+        'mean_s': mean,
+        'min_s': min(times),
+        'images_per_sec': 1.0 / mean if mean > 0 else None,
+        'peak_rss_mb': _peak_rss_mb(),
+    }
+
+
+# 在独立进程中测试一种分辨率，避免不同分辨率之间的内存峰值相互影响
+def bench_resolution(name: str, height: int, width: int, repeats: int, alpha: float) -> List[Dict[str, object]]:
+    image = synthetic_image(height, width)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, 'input.png')
+        output_path = os.path.join(tmp_dir, 'watermarked.png')
+        cv2.imwrite(input_path, image)
+
+        system = WatermarkingSystem(alpha=alpha)
+        results.append(_measure('embed', lambda: system.embed(input_path, output_path), repeats))
+        watermarked = system.embed(input_path, output_path)
+
+        extracted = system.extract(watermarked)
+        results.append(_measure('extract', lambda: system.extract(watermarked), repeats))
+        results.append(_measure('calculate_ncc', lambda: system.calculate_ncc(system.watermark, extracted), repeats))
+
+        # 攻击阶段的耗时包含攻击本身和随后的提取与NCC计算
+        tester = RobustnessTester(system)
+        for attack_name, param in ATTACK_PARAMS.items():
+            results.append(_measure(f'attack:{attack_name}',
+                                    lambda: tester.run_attack(attack_name, watermarked, param), repeats))
+
+        fast = FastWatermarker(WatermarkingSystem(alpha=alpha), (height, width))
+        fast_output = np.empty_like(image)
+        _, original_coeffs = fast.embed(image, out=fast_output)
+        original_coeffs = original_coeffs.copy()
+        results.append(_measure('fast_embed', lambda: fast.embed(image, out=fast_output), repeats))
+        results.append(_measure('fast_extract', lambda: fast.extract(fast_output, original_coeffs), repeats))
+
+    for result in results:
+        result['resolution'] = name
+        result['height'] = height
+        result['width'] = width
+    return results
+
+
+def run_benchmarks(resolutions=RESOLUTIONS, repeats: int = 3, alpha: float = 0.5) -> Dict[str, object]:
+    results = []
+    for name, height, width in resolutions:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            results.extend(pool.submit(bench_resolution, name, height, width, repeats, alpha).result())
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'repeats': repeats,
+            'alpha': alpha,
+        },
+        'results': results,
+    }
+
+
+# 与基准结果对比：平均耗时增加超过 threshold 比例的阶段视为性能回退
+def compare(current: Dict[str, object], baseline: Dict[str, object], threshold: float = 0.1) -> List[str]:
+    baseline_times = {(r['resolution'], r['stage']): r['mean_s'] for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        key = (result['resolution'], result['stage'])
+        if key not in baseline_times or baseline_times[key] <= 0:
+            continue
+        ratio = result['mean_s'] / baseline_times[key]
+        if ratio > 1 + threshold:
+            regressions.append(f"{key[0]:>10} {key[1]:<28} {baseline_times[key]*1000:9.2f} ms -> {result['mean_s']*1000:9.2f} ms ({ratio:.2f}x)")
+    return regressions
+
+
+def print_table(report: Dict[str, object]) -> None:
+    print(f"{'分辨率':>10} {'阶段':<28} {'平均耗时(ms)':>12} {'图像/秒':>10} {'峰值RSS(MB)':>12}")
+    for r in report['results']:
+        print(f"{r['resolution']:>10} {r['stage']:<28} {r['mean_s']*1000:12.2f} {r['images_per_sec']:10.2f} {r['peak_rss_mb']:12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="水印系统性能基准测试（使用合成图像，无需外部数据）")
+    parser.add_argument('--resolutions', nargs='*', help="只测试指定分辨率，如 512x512 1080p 4K")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--alpha', type=float, default=0.5)
+    parser.add_argument('--output', default='benchmark_results.json', help="结果JSON输出路径")
+    parser.add_argument('--baseline', help="用于对比的历史结果JSON")
+    parser.add_argument('--threshold', type=float, default=0.1, help="判定性能回退的耗时增幅")
+    args = parser.parse_args()
+
+    resolutions = RESOLUTIONS
+    if args.resolutions:
+        resolutions = [r for r in RESOLUTIONS if r[0] in args.resolutions]
+        if not resolutions:
+            parser.error(f"未知分辨率，可选: {', '.join(r[0] for r in RESOLUTIONS)}")
+
+    report = run_benchmarks(resolutions, args.repeats, args.alpha)
+    print_table(report)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"结果已保存到 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print("性能回退：")
+            for line in regressions:
+                print(line)
+            sys.exit(1)
+        print("未发现性能回退")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import cv2
+import numpy as np
+from typing import Optional, Tuple
+from watermarking import WatermarkingSystem, key_dtype
+
+KEY_DTYPE = np.float16      # 原始系数在密钥中的存储类型
+
+
+class Workspace:
+    """固定分辨率下嵌入与提取所需的全部缓冲区，分配一次后反复使用"""
+    def __init__(self, shape: Tuple[int, int], coeff_count: int, key_dtype=KEY_DTYPE):
+        height, width = shape
+        self.ycrcb = np.empty((height, width, 3), dtype=np.uint8)
+        self.y = np.empty((height, width), dtype=np.uint8)
+        self.y_float = np.empty((height, width), dtype=np.float32)
+        self.dct = np.empty((height, width), dtype=np.float32)
+        self.bgr = np.empty((height, width, 3), dtype=np.uint8)
+        self.resized = np.empty((height, width, 3), dtype=np.uint8)
+        self.original = np.empty(coeff_count, dtype=np.float32)    # 嵌入前掩码内的原始系数
+        self.coeffs = np.empty(coeff_count, dtype=np.float32)
+        self.work = np.empty(coeff_count, dtype=np.float32)
+        self.signs = np.empty(coeff_count, dtype=np.float32)       # 提取出的 ±1/0 水印（掩码内）
+        self.invalid = np.empty(coeff_count, dtype=bool)
+        self.key = np.empty(coeff_count, dtype=key_dtype)
+
+
+class FastWatermarker:
+    """固定分辨率的高吞吐模式：嵌入计划、水印和缓冲区只准备一次，
+    之后每幅图像只处理Y通道，全部运算写入预分配的缓冲区，不产生新的大数组"""
+    def __init__(self, watermarking_system: WatermarkingSystem, shape: Tuple[int, int],
+                 watermark_coeffs: Optional[np.ndarray] = None, key_dtype=KEY_DTYPE):
+        self.watermarking_system = watermarking_system
+        self.shape = (int(shape[0]), int(shape[1]))
+        self.plan = watermarking_system.get_plan(self.shape)
+        # 计划中的下标数组是只读的，np.take 对只读下标会整体复制一份，这里保留一份可写副本
+        self.indices = self.plan.indices.copy()
+        if watermark_coeffs is None:
+            watermark_coeffs = watermarking_system.generate_watermark(self.shape).reshape(-1)[self.plan.indices]
+        self.watermark_coeffs = np.asarray(watermark_coeffs, dtype=np.float32)     # 掩码内位置上的 ±1 水印
+        self.key_dtype = np.dtype(key_dtype)      # key_bytes 的定长记录类型
+        self.workspace = Workspace(self.shape, self.plan.indices.size, self.key_dtype)
+
+    # 由密钥文件（WatermarkingSystem.save_key 或本类 save_key 生成）构造提取用实例
+    @classmethod
+    def from_key(cls, key_path: str, watermarking_system: Optional[WatermarkingSystem] = None) -> Tuple['FastWatermarker', np.ndarray]:
+        with np.load(key_path) as key:
+            shape = tuple(int(v) for v in key['shape'])
+            alpha = float(key['alpha'])
+            coeffs = key['coeffs']
+            bits = key['bits']
+        watermarking_system = watermarking_system or WatermarkingSystem()
+        watermarking_system.alpha = alpha
+        plan = watermarking_system.get_plan(shape)
+        watermark_coeffs = np.unpackbits(bits, count=plan.indices.size).astype(np.float32) * 2 - 1
+        return cls(watermarking_system, shape, watermark_coeffs), coeffs
+
+    # 计算图像Y通道的DCT系数，结果保存在 workspace.dct 中
+    def _y_dct(self, image: np.ndarray) -> None:
+        workspace = self.workspace
+        cv2.cvtColor(image, cv2.COLOR_BGR2YCrCb, dst=workspace.ycrcb)
+        cv2.extractChannel(workspace.ycrcb, 0, dst=workspace.y)
+        np.copyto(workspace.y_float, workspace.y)
+        cv2.dct(workspace.y_float, dst=workspace.dct)
+
+    # 嵌入水印：返回水印图像（默认写入 workspace.bgr，下次调用时会被覆盖）及掩码内原始系数 workspace.original
+    def embed(self, image: np.ndarray, out: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        if image.shape[:2] != self.shape:
+            raise ValueError(f"图像尺寸 {image.shape[:2]} 与工作区尺寸 {self.shape} 不一致")
+        workspace = self.workspace
+        indices = self.indices
+        self._y_dct(image)
+
+        dct_flat = workspace.dct.reshape(-1)
+        np.take(dct_flat, indices, out=workspace.original, mode='clip')   # mode='raise' 会对out额外缓冲一份
+
+        # C' = C + alpha * W * |C|
+        np.abs(workspace.original, out=workspace.work)
+        workspace.work *= self.watermark_coeffs
+        workspace.work *= self.watermarking_system.alpha
+        workspace.work += workspace.original
+        dct_flat[indices] = workspace.work
+
+        # 只写回Y通道，Cr、Cb保持cvtColor的结果不动
+        cv2.idct(workspace.dct, dst=workspace.y_float)
+        np.clip(workspace.y_float, 0, 255, out=workspace.y_float)
+        np.copyto(workspace.y, workspace.y_float, casting='unsafe')
+        cv2.insertChannel(workspace.y, workspace.ycrcb, 0)
+
+        out = workspace.bgr if out is None else out
+        cv2.cvtColor(workspace.ycrcb, cv2.COLOR_YCrCb2BGR, dst=out)
+        return out, workspace.original
+
+    # 提取水印并返回NCC；提取出的 ±1/0 水印保存在 workspace.signs 中
+    def extract(self, image: np.ndarray, original_coeffs: np.ndarray) -> float:
+        workspace = self.workspace
+        if image.shape[:2] != self.shape:
+            image = cv2.resize(image, (self.shape[1], self.shape[0]), dst=workspace.resized)
+        self._y_dct(image)
+        np.take(workspace.dct.reshape(-1), self.indices, out=workspace.coeffs, mode='clip')
+
+        # alpha * |C| 恒为正，符号只取决于系数差；原系数接近0的位置不参与
+        np.copyto(workspace.work, original_coeffs)
+        np.subtract(workspace.coeffs, workspace.work, out=workspace.coeffs)
+        np.sign(workspace.coeffs, out=workspace.signs)
+        np.abs(workspace.work, out=workspace.work)
+        np.less_equal(workspace.work, 1e-4, out=workspace.invalid)
+        workspace.signs[workspace.invalid] = 0
+
+        # 水印与提取结果均为 ±1/0，NCC = Σ(w·e) / 非零个数，与 calculate_ncc 一致
+        energy = np.count_nonzero(workspace.signs)
+        if energy == 0:
+            return 0.0
+        return float(np.dot(workspace.signs, self.watermark_coeffs)) / energy
+
+    # 原始系数按 key_dtype 写入预分配缓冲区，返回其内容视图，可直接写入文件。
+    # 各帧记录定长，不能逐帧改变类型：系数超出float16表示范围时报错，需以 key_dtype=np.float32 创建
+    def key_bytes(self, original_coeffs: np.ndarray) -> memoryview:
+        workspace = self.workspace
+        if self.key_dtype == np.float16:
+            np.abs(original_coeffs, out=workspace.work)
+            if workspace.work.size and workspace.work.max() > np.finfo(np.float16).max:
+                raise OverflowError("原始系数超出float16表示范围，请以 key_dtype=np.float32 创建")
+        np.copyto(workspace.key, original_coeffs, casting='same_kind')
+        return workspace.key.data
+
+    # 保存与 WatermarkingSystem.save_key 相同格式的提取密钥
+    def save_key(self, key_path: str, original_coeffs: np.ndarray) -> None:
+        with open(key_path, 'wb') as key_file:
+            np.savez(
+                key_file,
+                shape=np.array(self.shape, dtype=np.int64),
+                alpha=np.float64(self.watermarking_system.alpha),
+                coeffs=np.asarray(original_coeffs, dtype=key_dtype(original_coeffs, self.key_dtype)),
+                bits=np.packbits(self.watermark_coeffs > 0),
+            )
@@ -0,0 +1,96 @@
+import os
+import hashlib
+import tempfile
+import numpy as np
+from typing import Callable, Optional
+
+
+# 计算缓存键：数组按 形状、类型和内容 计入哈希，其余参数按repr计入
+def make_cache_key(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            part = np.ascontiguousarray(part)
+            digest.update(repr((part.shape, part.dtype.str)).encode())
+            digest.update(part.data)
+        else:
+            digest.update(repr(part).encode())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """内容寻址的磁盘缓存：以哈希为文件名保存数组，总大小超出上限时按最近使用时间淘汰"""
+    def __init__(self, cache_dir: str, max_bytes: int = 1 << 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size = sum(stat.st_size for _, stat in self._entries())
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + '.npy')
+
+    def _entries(self):
+        for shard in os.listdir(self.cache_dir):
+            shard_dir = os.path.join(self.cache_dir, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                if name.endswith('.npy'):
+                    path = os.path.join(shard_dir, name)
+                    try:
+                        yield path, os.stat(path)
+                    except FileNotFoundError:   # 可能已被其他进程淘汰
+                        continue
+
+    # 读取缓存，命中时更新修改时间作为最近使用时间
+    def get(self, key: str) -> Optional[np.ndarray]:
+        path = self._path(key)
+        try:
+            array = np.load(path)
+            os.utime(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        return array
+
+    # 写入缓存：先写临时文件再原子替换，多个进程共享同一目录时不会读到半个文件
+    def put(self, key: str, array: np.ndarray) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as tmp_file:
+            np.save(tmp_file, array)
+        os.replace(tmp_path, path)
+
+        self._size += os.path.getsize(path)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def get_or_compute(self, key: str, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        array = self.get(key)
+        if array is None:
+            array = compute()
+            self.put(key, array)
+        return array
+
+    # 按最近使用时间从旧到新删除条目，直到总大小降到上限的90%以下
+    def evict(self) -> None:
+        entries = sorted(self._entries(), key=lambda entry: entry[1].st_mtime)
+        self._size = sum(stat.st_size for _, stat in entries)
+        target = self.max_bytes * 0.9
+        for path, stat in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= stat.st_size
+
+    def clear(self) -> None:
+        for path, _ in list(self._entries()):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._size = 0
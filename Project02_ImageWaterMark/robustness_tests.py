@@ -1,77 +1,141 @@
 import cv2
 import numpy as np
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
 from watermarking import WatermarkingSystem
+from result_cache import ResultCache, make_cache_key
+
+# 各类攻击：输入带水印图像与攻击参数，返回攻击后的图像（模块级函数，便于在工作进程中调用）
+
+# 旋转
+def attack_rotation(watermarked_image: np.ndarray, angle: float) -> np.ndarray:
+    height, width = watermarked_image.shape[:2]
+    center = (width // 2, height // 2)
+    rotation_matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
+    return cv2.warpAffine(watermarked_image, rotation_matrix, (width, height), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+
+# 缩放后还原到原尺寸
+def attack_scaling(watermarked_image: np.ndarray, scale: float) -> np.ndarray:
+    scaled_image = cv2.resize(watermarked_image, None, fx=scale, fy=scale)
+    return cv2.resize(scaled_image, (watermarked_image.shape[1], watermarked_image.shape[0]))
+
+# 中心裁剪，crop_ratio为保留部分占短边的比例
+def attack_cropping(watermarked_image: np.ndarray, crop_ratio: float) -> np.ndarray:
+    height, width = watermarked_image.shape[:2]
+    crop_size = int(min(height, width) * crop_ratio)
+    start_x = (width - crop_size) // 2
+    start_y = (height - crop_size) // 2
+    return watermarked_image[start_y:start_y+crop_size, start_x:start_x+crop_size]
+
+# 亮度
+def attack_brightness(watermarked_image: np.ndarray, value: int) -> np.ndarray:
+    hsv = cv2.cvtColor(watermarked_image, cv2.COLOR_BGR2HSV)
+    h, s, v = cv2.split(hsv)
+    v = np.clip(v.astype(np.int16) + value, 0, 255).astype(hsv.dtype)
+    hsv = cv2.merge([h, s, v])
+    return cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
+
+# 对比度
+def attack_contrast(watermarked_image: np.ndarray, alpha: float) -> np.ndarray:
+    return cv2.convertScaleAbs(watermarked_image, alpha=alpha, beta=0)
+
+# 高斯噪声，noise_level为噪声方差
+def attack_noise(watermarked_image: np.ndarray, noise_level: float) -> np.ndarray:
+    row, col, ch = watermarked_image.shape
+    mean = 0
+    var = noise_level
+    sigma = var ** 0.5
+    gauss = np.random.normal(mean, sigma, (row, col, ch))
+    noisy_image = watermarked_image + gauss
+    return np.clip(noisy_image, 0, 255).astype(np.uint8)
+
+# JPEG压缩
+def attack_jpeg_compression(watermarked_image: np.ndarray, quality: int) -> np.ndarray:
+    encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)]
+    result, encimg = cv2.imencode('.jpg', watermarked_image, encode_param)
+    return cv2.imdecode(encimg, 1)
+
+ATTACKS: Dict[str, Callable[[np.ndarray, float], np.ndarray]] = {
+    'rotation': attack_rotation,
+    'scaling': attack_scaling,
+    'cropping': attack_cropping,
+    'brightness': attack_brightness,
+    'contrast': attack_contrast,
+    'noise': attack_noise,
+    'jpeg_compression': attack_jpeg_compression,
+}
+
+# 结果取决于全局随机状态的攻击：只有给定种子时才可缓存
+STOCHASTIC_ATTACKS = frozenset({'noise'})
+
+
+class AttackOutcome(NamedTuple):
+    """一次攻击的结果：攻击后的图像、NCC，以及计算NCC时提取出的水印（可直接用于保存或可视化）"""
+    attacked_image: np.ndarray
+    ncc: float
+    extracted_watermark: np.ndarray
+
 
 class RobustnessTester:
-    def __init__(self, watermarking_system: WatermarkingSystem):
+    def __init__(self, watermarking_system: WatermarkingSystem, cache: Optional[ResultCache] = None):
         self.watermarking_system = watermarking_system
+        self.cache = cache      # 非空时缓存攻击后的图像，并同时用于水印系统的提取结果
+        if cache is not None:
+            watermarking_system.cache = cache
 
-    # 旋转测试        
-    def test_rotation(self, watermarked_image: np.ndarray, angle: float) -> float:
-        height, width = watermarked_image.shape[:2]
-        center = (width // 2, height // 2)
-        rotation_matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
-        rotated_image = cv2.warpAffine(watermarked_image, rotation_matrix, (width, height), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
-        extracted_watermark = self.watermarking_system.extract(rotated_image)
+    # 从攻击后的图像中提取水印并计算NCC，掩码等复用水印系统当前的嵌入计划；返回 (提取出的水印, NCC)
+    def _evaluate(self, attacked_image: np.ndarray) -> Tuple[np.ndarray, float]:
+        extracted_watermark = self.watermarking_system.extract(attacked_image)
         ncc = self.watermarking_system.calculate_ncc(self.watermarking_system.watermark, extracted_watermark)
-        return ncc
+        return extracted_watermark, ncc
+
+    # 按名称执行一次攻击，返回攻击后的图像、NCC及提取出的水印，攻击与提取都只计算一次。
+    # 随机攻击给定 seed 时先以其重置随机状态，seed 同时计入缓存键；未给定 seed 时不使用缓存，每次重新采样
+    def run_attack(self, attack_name: str, watermarked_image: np.ndarray, param: float,
+                   seed: Optional[int] = None) -> AttackOutcome:
+        if attack_name not in ATTACKS:
+            raise ValueError(f"未知的攻击类型 {attack_name}")
+        stochastic = attack_name in STOCHASTIC_ATTACKS
+
+        def attack() -> np.ndarray:
+            if stochastic and seed is not None:
+                np.random.seed(seed)
+            return ATTACKS[attack_name](watermarked_image, param)
+
+        if self.cache is None or (stochastic and seed is None):
+            attacked_image = attack()
+        else:
+            if stochastic:
+                key = make_cache_key('attack', attack_name, param, seed, watermarked_image)
+            else:
+                key = make_cache_key('attack', attack_name, param, watermarked_image)
+            attacked_image = self.cache.get_or_compute(key, attack)
+        extracted_watermark, ncc = self._evaluate(attacked_image)
+        return AttackOutcome(attacked_image, ncc, extracted_watermark)
+
+    # 旋转测试
+    def test_rotation(self, watermarked_image: np.ndarray, angle: float) -> float:
+        return self.run_attack('rotation', watermarked_image, angle).ncc
 
     # 图像缩放
     def test_scaling(self, watermarked_image: np.ndarray, scale: float) -> float:
-        scaled_image = cv2.resize(watermarked_image, None, fx=scale, fy=scale)
-        scaled_image = cv2.resize(scaled_image, (watermarked_image.shape[1], watermarked_image.shape[0]))
-        extracted_watermark = self.watermarking_system.extract(scaled_image)
-        ncc = self.watermarking_system.calculate_ncc(self.watermarking_system.watermark, extracted_watermark)
-        return ncc
-    
+        return self.run_attack('scaling', watermarked_image, scale).ncc
+
     # 图像裁剪函数
     def test_cropping(self, watermarked_image: np.ndarray, crop_ratio: float) -> float:
-        height, width = watermarked_image.shape[:2]
-        crop_size = int(min(height, width) * crop_ratio)
-        start_x = (width - crop_size) // 2
-        start_y = (height - crop_size) // 2
-        cropped_image = watermarked_image[start_y:start_y+crop_size, start_x:start_x+crop_size]
-        extracted_watermark = self.watermarking_system.extract(cropped_image)
-        ncc = self.watermarking_system.calculate_ncc(self.watermarking_system.watermark, extracted_watermark)
-        return ncc   
-    
+        return self.run_attack('cropping', watermarked_image, crop_ratio).ncc
+
     # 图像亮度
     def test_brightness(self, watermarked_image: np.ndarray, value: int) -> float:
-        hsv = cv2.cvtColor(watermarked_image, cv2.COLOR_BGR2HSV)
-        h, s, v = cv2.split(hsv)
-        v = np.clip(v + value, 0, 255).astype(hsv.dtype)
-        hsv = cv2.merge([h, s, v])
-        brightened_image = cv2.cvtColor(hsv, cv2.COLOR_HSV2BGR)
-        extracted_watermark = self.watermarking_system.extract(brightened_image)
-        ncc = self.watermarking_system.calculate_ncc(self.watermarking_system.watermark, extracted_watermark)
-        return ncc
-    
+        return self.run_attack('brightness', watermarked_image, value).ncc
+
      # 图像对比度
     def test_contrast(self, watermarked_image: np.ndarray, alpha: float) -> float:
-        contrasted_image = cv2.convertScaleAbs(watermarked_image, alpha=alpha, beta=0)
-        extracted_watermark = self.watermarking_system.extract(contrasted_image)
-        ncc = self.watermarking_system.calculate_ncc(self.watermarking_system.watermark, extracted_watermark)
-        return ncc
-    
+        return self.run_attack('contrast', watermarked_image, alpha).ncc
+
     # 图像噪声
-    def test_noise(self, watermarked_image: np.ndarray, noise_level: float) -> float:
-        row, col, ch = watermarked_image.shape
-        mean = 0
-        var = noise_level
-        sigma = var ** 0.5
-        gauss = np.random.normal(mean, sigma, (row, col, ch))
-        gauss = gauss.reshape(row, col, ch)
-        noisy_image = watermarked_image + gauss
-        noisy_image = np.clip(noisy_image, 0, 255).astype(np.uint8)
-        extracted_watermark = self.watermarking_system.extract(noisy_image)
-        ncc = self.watermarking_system.calculate_ncc(self.watermarking_system.watermark, extracted_watermark)
-        return ncc
-        
+    def test_noise(self, watermarked_image: np.ndarray, noise_level: float, seed: Optional[int] = None) -> float:
+        return self.run_attack('noise', watermarked_image, noise_level, seed).ncc
+
     # JPEG压缩测试
     def test_jpeg_compression(self, watermarked_image: np.ndarray, quality: int) -> float:
-        encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
-        result, encimg = cv2.imencode('.jpg', watermarked_image, encode_param)
-        decimg = cv2.imdecode(encimg, 1)
-        extracted_watermark = self.watermarking_system.extract(decimg)
-        ncc = self.watermarking_system.calculate_ncc(self.watermarking_system.watermark, extracted_watermark)
-        return ncc
\ No newline at end of file
+        return self.run_attack('jpeg_compression', watermarked_image, quality).ncc
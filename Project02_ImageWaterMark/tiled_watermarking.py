@@ -0,0 +1,191 @@
+import cv2
+import tempfile
+import numpy as np
+from typing import Iterator, Optional, Tuple, Union
+from watermarking import WatermarkingSystem
+
+ImageSource = Union[str, np.ndarray]
+
+
+# 打开图像：.npy 文件以内存映射方式按需读取，其余格式由 cv2 整体解码
+def open_image(source: ImageSource) -> np.ndarray:
+    if isinstance(source, np.ndarray):
+        return source
+    if source.lower().endswith('.npy'):
+        return np.load(source, mmap_mode='r')
+    image = cv2.imread(source, cv2.IMREAD_COLOR)
+    if image is None:
+        raise FileNotFoundError(f"无法读取图像文件 {source}")
+    return image
+
+
+# 将普通图像文件转换为可内存映射的 .npy 文件（H, W, 3, uint8, BGR）
+def convert_to_npy(image_path: str, npy_path: str) -> None:
+    image = open_image(image_path)
+    buffer = np.lib.format.open_memmap(npy_path, mode='w+', dtype=np.uint8, shape=image.shape)
+    buffer[:] = image
+    buffer.flush()
+    del buffer
+
+
+# 将 .npy 图像编码为普通图像文件；cv2.imwrite 需要整幅图像，此步骤会把图像完整读入内存
+def convert_from_npy(npy_path: str, image_path: str) -> None:
+    if not cv2.imwrite(image_path, np.asarray(np.load(npy_path, mmap_mode='r'))):
+        raise ValueError(f"无法写入图像文件 {image_path}")
+
+
+# 按行优先顺序划分分块，返回 (top, left, height, width)
+def iter_tiles(shape: Tuple[int, int], tile_size: int) -> Iterator[Tuple[int, int, int, int]]:
+    height, width = shape[:2]
+    for top in range(0, height, tile_size):
+        for left in range(0, width, tile_size):
+            yield top, left, min(tile_size, height - top), min(tile_size, width - left)
+
+
+class TiledWatermarker:
+    """分块DCT水印：逐块读写图像，峰值内存只与分块大小有关，与图像大小无关"""
+    def __init__(self, watermarking_system: WatermarkingSystem, tile_size: int = 512):
+        if tile_size < 8 or tile_size % 2 != 0:
+            raise ValueError("分块大小必须为不小于8的偶数")
+        self.watermarking_system = watermarking_system
+        self.tile_size = tile_size
+        self.original_shape: Optional[Tuple[int, int]] = None
+        self.key: Optional[np.ndarray] = None      # 各分块中频掩码内的原始DCT系数，按分块顺序首尾相连
+
+    # 分块内参与DCT的区域：cv2.dct要求边长为偶数，边缘的奇数行/列保持原样
+    def _tile_plans(self, shape: Tuple[int, int]):
+        for tile_index, (top, left, height, width) in enumerate(iter_tiles(shape, self.tile_size)):
+            dct_shape = (height & ~1, width & ~1)
+            plan = None
+            if dct_shape[0] > 0 and dct_shape[1] > 0:
+                plan = self.watermarking_system.get_plan(dct_shape)
+            yield tile_index, (top, left, height, width), plan
+
+    # 分块在掩码内位置上的水印值：自定义水印按分块尺寸缩放，随机水印由(种子, 分块序号)确定性生成
+    def _tile_watermark(self, plan, tile_index: int) -> np.ndarray:
+        if plan.watermark is not None:
+            return plan.watermark.reshape(-1)[plan.indices]
+        rng = np.random.default_rng((self.watermarking_system.seed, tile_index))
+        return rng.choice(np.array([-1, 1], dtype=np.int8), size=plan.indices.size)
+
+    # 分块嵌入水印：输出以内存映射方式逐块写入 .npy 文件（需要普通图像格式时用 convert_from_npy 转换）；
+    # 原始系数写入 key_path，未指定时写入匿名临时文件，同样按需换页，不常驻内存
+    def embed(self, image: ImageSource, output_path: str, key_path: Optional[str] = None) -> np.ndarray:
+        if not output_path.lower().endswith('.npy'):
+            raise ValueError("分块模式只能输出 .npy 文件，否则需要在内存中保存整幅图像；请在嵌入后用 convert_from_npy 转换")
+        image = open_image(image)
+        shape = image.shape[:2]
+        alpha = self.watermarking_system.alpha
+
+        key_size = sum(plan.indices.size for _, _, plan in self._tile_plans(shape) if plan is not None)
+        if key_path:
+            key = np.lib.format.open_memmap(key_path, mode='w+', dtype=np.float32, shape=(key_size,))
+        else:
+            # 临时文件关闭后即被删除，映射持有自己的文件描述符，数据随 key 释放
+            with tempfile.TemporaryFile() as key_file:
+                key_file.truncate(max(key_size, 1) * np.dtype(np.float32).itemsize)
+                key = np.memmap(key_file, dtype=np.float32, mode='r+', shape=(key_size,))
+
+        output = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.uint8, shape=image.shape)
+
+        offset = 0
+        for tile_index, (top, left, height, width), plan in self._tile_plans(shape):
+            tile = np.array(image[top:top+height, left:left+width])
+            if plan is not None:
+                dct_height, dct_width = plan.shape
+                tile_ycrcb = cv2.cvtColor(tile[:dct_height, :dct_width], cv2.COLOR_BGR2YCrCb)
+                dct_y = cv2.dct(np.float32(tile_ycrcb[:, :, 0]))
+
+                dct_flat = dct_y.reshape(-1)
+                coeffs = dct_flat[plan.indices]
+                key[offset:offset + coeffs.size] = coeffs
+                offset += coeffs.size
+                dct_flat[plan.indices] = coeffs + alpha * self._tile_watermark(plan, tile_index) * np.abs(coeffs)
+
+                tile_ycrcb[:, :, 0] = np.uint8(np.clip(cv2.idct(dct_y), 0, 255))
+                tile[:dct_height, :dct_width] = cv2.cvtColor(tile_ycrcb, cv2.COLOR_YCrCb2BGR)
+            output[top:top+height, left:left+width] = tile
+
+        self.original_shape = shape
+        self.key = np.load(key_path, mmap_mode='r') if key_path else key
+
+        output.flush()
+        return output
+
+    # 加载已落盘的原始系数，用于在另一进程中提取
+    def load_key(self, key_path: str, shape: Tuple[int, int]) -> None:
+        self.key = np.load(key_path, mmap_mode='r')
+        self.original_shape = (int(shape[0]), int(shape[1]))
+
+    # 按需缩放：只读取目标分块所需的源图像窗口，按与 cv2.resize 相同的坐标映射做等效的双线性采样，
+    # 尺寸不符的大图像也无需整幅缩放。cv2.remap 与 cv2.resize 的定点插值实现不同，像素值可能相差 ±1
+    @staticmethod
+    def _resized_tile(image: np.ndarray, shape: Tuple[int, int], top: int, left: int,
+                      height: int, width: int) -> np.ndarray:
+        src_height, src_width = image.shape[:2]
+        ys = (np.arange(top, top + height) + 0.5) * (src_height / shape[0]) - 0.5
+        xs = (np.arange(left, left + width) + 0.5) * (src_width / shape[1]) - 0.5
+        y0 = min(max(int(np.floor(ys[0])), 0), src_height - 1)
+        x0 = min(max(int(np.floor(xs[0])), 0), src_width - 1)
+        y1 = min(max(int(np.floor(ys[-1])) + 2, y0 + 1), src_height)
+        x1 = min(max(int(np.floor(xs[-1])) + 2, x0 + 1), src_width)
+        window = np.ascontiguousarray(image[y0:y1, x0:x1])
+        # 坐标截断到窗口边界，与 cv2.resize 一样在图像边缘复制像素
+        map_y = np.clip(ys - y0, 0, y1 - y0 - 1).astype(np.float32)
+        map_x = np.clip(xs - x0, 0, x1 - x0 - 1).astype(np.float32)
+        map_x, map_y = np.broadcast_to(map_x, (height, width)), np.broadcast_to(map_y[:, None], (height, width))
+        return cv2.remap(window, np.ascontiguousarray(map_x), np.ascontiguousarray(map_y),
+                         cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+    # 分块提取水印并返回整体NCC；output_path 非空时将提取出的 ±1 水印逐块写入 .npy
+    def extract(self, watermarked_image: ImageSource, output_path: Optional[str] = None) -> float:
+        if self.key is None:
+            raise RuntimeError("请先嵌入水印再进行提取")
+
+        image = open_image(watermarked_image)
+        resize = image.shape[:2] != self.original_shape
+
+        extracted = None
+        if output_path:
+            extracted = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.int8, shape=self.original_shape)
+
+        # 逐块累加NCC的分子与能量项，结果与 calculate_ncc 在整幅水印上的计算一致
+        numerator = 0.0
+        orig_energy = 0.0
+        extr_energy = 0.0
+        offset = 0
+        for tile_index, (top, left, height, width), plan in self._tile_plans(self.original_shape):
+            if plan is None:
+                continue
+            dct_height, dct_width = plan.shape
+            if resize:
+                tile = self._resized_tile(image, self.original_shape, top, left, dct_height, dct_width)
+            else:
+                tile = np.ascontiguousarray(image[top:top+dct_height, left:left+dct_width])
+            tile_y = cv2.cvtColor(tile, cv2.COLOR_BGR2YCrCb)[:, :, 0]
+            coeffs = cv2.dct(np.float32(tile_y)).reshape(-1)[plan.indices]
+
+            original_coeffs = np.asarray(self.key[offset:offset + coeffs.size])
+            offset += coeffs.size
+
+            # alpha * |C| 恒为正，符号只取决于系数差
+            signs = np.sign(coeffs - original_coeffs)
+            signs[np.abs(original_coeffs) <= 1e-4] = 0
+            watermark = self._tile_watermark(plan, tile_index)
+
+            numerator += float(np.dot(signs, watermark))
+            orig_energy += float(np.count_nonzero(signs))
+            extr_energy += float(np.dot(signs, signs))
+
+            if extracted is not None:
+                tile_watermark = np.zeros(dct_height * dct_width, dtype=np.int8)
+                tile_watermark[plan.indices] = signs
+                extracted[top:top+dct_height, left:left+dct_width] = tile_watermark.reshape(plan.shape)
+
+        if extracted is not None:
+            extracted.flush()
+
+        denominator = np.sqrt(orig_energy * extr_energy)
+        if denominator > 1e-10:     # 避免除以0
+            return numerator / denominator
+        return 0.0
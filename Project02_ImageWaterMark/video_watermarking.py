@@ -0,0 +1,121 @@
+import os
+import cv2
+import numpy as np
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple
+from watermarking import WatermarkingSystem
+from fast_watermarking import FastWatermarker, KEY_DTYPE
+
+
+# 逐帧读取视频
+def iter_frames(video_path: str) -> Iterator[np.ndarray]:
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise FileNotFoundError(f"无法打开视频文件 {video_path}")
+    try:
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield frame
+    finally:
+        capture.release()
+
+
+def _coeffs_path(key_path: str) -> str:
+    return key_path + '.coeffs'
+
+
+class VideoWatermarker:
+    """视频水印：整段视频使用同一个嵌入计划和水印，逐帧复用预分配的缓冲区"""
+    def __init__(self, watermarking_system: WatermarkingSystem, key_dtype=KEY_DTYPE):
+        self.watermarking_system = watermarking_system
+        self.key_dtype = np.dtype(key_dtype)     # 逐帧原始系数的存储类型，系数超出float16范围时需使用float32
+        self.fast: Optional[FastWatermarker] = None     # 按首帧分辨率创建
+
+    # 逐帧嵌入水印；产出的帧是复用的缓冲区，调用方需在取下一帧前写出或复制
+    def embed_frames(self, frames: Iterable[np.ndarray], key_file: Optional[BinaryIO] = None) -> Iterator[np.ndarray]:
+        for frame in frames:
+            if self.fast is None:
+                self.fast = FastWatermarker(self.watermarking_system, frame.shape[:2], key_dtype=self.key_dtype)
+            watermarked_frame, original_coeffs = self.fast.embed(frame)
+            if key_file is not None:
+                key_file.write(self.fast.key_bytes(original_coeffs))
+            yield watermarked_frame
+
+    # 嵌入整段视频：水印帧写入 output_path，提取密钥写入 key_path（元数据）与 key_path.coeffs（逐帧原始系数）
+    # 写入器在读帧前按源视频分辨率创建并检查是否成功打开；中途出错时删除不完整的输出视频与密钥文件后再抛出异常
+    def embed_video(self, input_path: str, output_path: str, key_path: str, fourcc: str = 'mp4v') -> int:
+        capture = cv2.VideoCapture(input_path)
+        if not capture.isOpened():
+            raise FileNotFoundError(f"无法打开视频文件 {input_path}")
+        fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        capture.release()
+
+        writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+        if not writer.isOpened():
+            writer.release()
+            raise OSError(f"无法创建视频文件 {output_path}（编码器 {fourcc}，分辨率 {width}x{height}）")
+
+        frame_count = 0
+        try:
+            try:
+                with open(_coeffs_path(key_path), 'wb') as key_file:
+                    for frame in self.embed_frames(iter_frames(input_path), key_file):
+                        writer.write(frame)
+                        frame_count += 1
+            finally:
+                writer.release()
+
+            if self.fast is not None:
+                with open(key_path, 'wb') as meta_file:
+                    np.savez(
+                        meta_file,
+                        shape=np.array(self.fast.shape, dtype=np.int64),
+                        alpha=np.float64(self.watermarking_system.alpha),
+                        bits=np.packbits(self.fast.watermark_coeffs > 0),
+                        frame_count=np.int64(frame_count),
+                        coeffs_dtype=np.array(self.key_dtype.str),
+                    )
+        except BaseException:
+            for path in (output_path, _coeffs_path(key_path), key_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            raise
+        return frame_count
+
+    # 加载 embed_video 写出的密钥，返回逐帧原始系数（内存映射，形状为 帧数 × 系数个数）
+    def load_key(self, key_path: str) -> np.ndarray:
+        with np.load(key_path) as meta:
+            shape = tuple(int(v) for v in meta['shape'])
+            self.watermarking_system.alpha = float(meta['alpha'])
+            bits = meta['bits']
+            dtype = np.dtype(str(meta['coeffs_dtype'])) if 'coeffs_dtype' in meta.files else np.dtype(KEY_DTYPE)
+        plan = self.watermarking_system.get_plan(shape)
+        watermark_coeffs = np.unpackbits(bits, count=plan.indices.size).astype(np.float32) * 2 - 1
+        self.fast = FastWatermarker(self.watermarking_system, shape, watermark_coeffs, key_dtype=dtype)
+        return np.memmap(_coeffs_path(key_path), dtype=dtype, mode='r').reshape(-1, plan.indices.size)
+
+    # 逐帧提取水印，产出 (当前帧NCC, 截至当前帧的累计NCC)
+    def extract_frames(self, frames: Iterable[np.ndarray], original_coeffs: np.ndarray) -> Iterator[Tuple[float, float]]:
+        signs = self.fast.workspace.signs
+        numerator = 0.0
+        energy = 0.0
+        for frame_index, frame in enumerate(frames):
+            if frame_index >= len(original_coeffs):
+                break
+            frame_ncc = self.fast.extract(frame, original_coeffs[frame_index])
+
+            # 累计NCC由各帧的分子与非零个数相加得到
+            frame_energy = np.count_nonzero(signs)
+            numerator += frame_ncc * frame_energy
+            energy += frame_energy
+            running_ncc = numerator / energy if energy > 0 else 0.0
+            yield frame_ncc, running_ncc
+
+    def extract_video(self, video_path: str, key_path: str) -> Iterator[Tuple[float, float]]:
+        original_coeffs = self.load_key(key_path)
+        return self.extract_frames(iter_frames(video_path), original_coeffs)
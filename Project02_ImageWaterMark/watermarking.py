@@ -1,33 +1,122 @@
+import os
+import hashlib
 import cv2
 import numpy as np
+from functools import lru_cache
 from typing import Tuple, Optional
+from result_cache import make_cache_key
+
+PLAN_CACHE_SIZE = 16    # 嵌入计划缓存容量（按分辨率、强度、水印来源区分）
+
+
+# 生成中频区域掩码：以DCT系数平面中心为圆心、min(cx, cy)/2为半径的圆形区域
+def mid_frequency_mask(shape: Tuple[int, int]) -> np.ndarray:
+    height, width = shape[:2]
+    center_x, center_y = width // 2, height // 2
+    radius = min(center_x, center_y) // 2
+    
+    y_indices, x_indices = np.ogrid[:height, :width]
+    return ((x_indices - center_x)**2 + (y_indices - center_y)**2) <= radius**2
+
+
+# 密钥中原始系数的存储类型：默认float16，系数超出其表示范围时退回float32
+def key_dtype(coeffs: np.ndarray, dtype=np.float16) -> np.dtype:
+    if np.dtype(dtype) == np.float16 and coeffs.size and np.abs(coeffs).max() > np.finfo(np.float16).max:
+        return np.dtype(np.float32)
+    return np.dtype(dtype)
+
+
+# 读取水印图像：调整大小，Otsu二值化为 ±1
+def load_binary_watermark(watermark_image_path: str, shape: Tuple[int, int]) -> np.ndarray:
+    watermark_img = cv2.imread(watermark_image_path, cv2.IMREAD_GRAYSCALE)
+    if watermark_img is None:
+        raise FileNotFoundError(f"无法读取水印图像 {watermark_image_path}")
+        
+    watermark_img = cv2.resize(watermark_img, (shape[1], shape[0]))
+    
+    _, binary_watermark = cv2.threshold(
+        watermark_img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU
+    )
+    
+    binary_watermark = np.where(binary_watermark > 127, 1, -1)
+    return binary_watermark.astype(np.int8)
+
+
+class EmbeddingPlan:
+    """嵌入计划：同一分辨率、强度与水印来源下可复用的掩码、系数下标及二值化水印"""
+    def __init__(self, shape: Tuple[int, int], alpha: float, watermark_image_path: Optional[str] = None):
+        self.shape = shape
+        self.alpha = alpha
+        self.mask = mid_frequency_mask(shape)
+        self.indices = np.flatnonzero(self.mask)    # 掩码内系数在展平数组中的下标
+        self.mask.setflags(write=False)
+        self.indices.setflags(write=False)
+        
+        # 未指定水印图像时使用随机水印，每次嵌入重新生成，不放入计划
+        self.watermark: Optional[np.ndarray] = None
+        if watermark_image_path:
+            self.watermark = load_binary_watermark(watermark_image_path, shape)
+            self.watermark.setflags(write=False)
+
+
+@lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _cached_plan(shape: Tuple[int, int], alpha: float, source: Optional[Tuple[str, int]]) -> EmbeddingPlan:
+    return EmbeddingPlan(shape, alpha, source[0] if source else None)
+
+
+# 获取嵌入计划：水印来源以（绝对路径, 修改时间）标识，文件被替换后自动重建
+def get_embedding_plan(shape: Tuple[int, int], alpha: float,
+                       watermark_image_path: Optional[str] = None) -> EmbeddingPlan:
+    source = None
+    if watermark_image_path:
+        try:
+            mtime = os.stat(watermark_image_path).st_mtime_ns
+        except OSError:
+            raise FileNotFoundError(f"无法读取水印图像 {watermark_image_path}")
+        source = (os.path.abspath(watermark_image_path), mtime)
+    return _cached_plan((int(shape[0]), int(shape[1])), float(alpha), source)
+
+
+# 清空嵌入计划缓存
+def clear_plan_cache() -> None:
+    _cached_plan.cache_clear()
+
 
 class WatermarkingSystem:
     def __init__(self, alpha: float = 0.1, seed: int = 42, watermark_image_path: Optional[str] = None):
         self.alpha = alpha      #  水印强度参数
+        self.seed = seed
         np.random.seed(seed)
         self.original_dct: Optional[np.ndarray] = None
         self.watermark: Optional[np.ndarray] = None
         self.original_shape: Optional[Tuple[int, int]] = None
         self.watermark_image_path = watermark_image_path    # 水印图像路径
+        self.plan: Optional[EmbeddingPlan] = None
+        self._weights: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+        self._key_path: Optional[str] = None     # 通过 load_key 指定、尚未读入的提取密钥
+        self._fingerprint: Optional[str] = None
+        self.cache = None       # 可选的 result_cache.ResultCache，用于缓存提取结果
     
-    # 处理自定义水印图像：调整大小，二值化
+    # 水印：通过 load_key 加载密钥时，在首次访问或首次提取时才从密钥文件读入
+    @property
+    def watermark(self) -> Optional[np.ndarray]:
+        if self._watermark is None and self._key_path is not None:
+            self._extraction_weights()
+        return self._watermark
+    
+    @watermark.setter
+    def watermark(self, value: Optional[np.ndarray]) -> None:
+        self._watermark = value
+    
+    # 获取当前分辨率对应的嵌入计划（来自共享的LRU缓存）
+    def get_plan(self, shape: Tuple[int, int]) -> EmbeddingPlan:
+        return get_embedding_plan(shape, self.alpha, self.watermark_image_path)
+    
+    # 处理自定义水印图像：调整大小，二值化（结果由嵌入计划缓存）
     def process_custom_watermark(self, shape: Tuple[int, int]) -> np.ndarray:
         if self.watermark_image_path is None:
             raise ValueError("未提供水印图像路径")
-            
-        watermark_img = cv2.imread(self.watermark_image_path, cv2.IMREAD_GRAYSCALE)
-        if watermark_img is None:
-            raise FileNotFoundError(f"无法读取水印图像 {self.watermark_image_path}")
-            
-        watermark_img = cv2.resize(watermark_img, (shape[1], shape[0]))
-        
-        _, binary_watermark = cv2.threshold(
-            watermark_img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU
-        )
-        
-        binary_watermark = np.where(binary_watermark > 127, 1, -1)
-        return binary_watermark.astype(np.int8)
+        return self.get_plan(shape).watermark
     
     # 生成水印：根据是否提供水印图像路径选择生成方式
     def generate_watermark(self, shape: Tuple[int, int]) -> np.ndarray:
@@ -45,6 +134,10 @@ class WatermarkingSystem:
             raise FileNotFoundError(f"无法读取图像文件 {image_path}")
             
         self.original_shape = image.shape[:2]
+        self.plan = self.get_plan(self.original_shape)
+        self._weights = None
+        self._fingerprint = None
+        self._key_path = None
         
         image_ycrcb = cv2.cvtColor(image, cv2.COLOR_BGR2YCrCb)
         y, cr, cb = cv2.split(image_ycrcb)
@@ -55,14 +148,10 @@ class WatermarkingSystem:
         
         self.original_dct = dct_y.copy()
         
-        height, width = dct_y.shape
-        center_x, center_y = width // 2, height // 2
-        radius = min(center_x, center_y) // 2
-        
-        y_indices, x_indices = np.ogrid[:height, :width]
-        mask = ((x_indices - center_x)**2 + (y_indices - center_y)**2) <= radius**2
-        
-        dct_y[mask] += self.alpha * self.watermark[mask] * np.abs(dct_y[mask])
+        indices = self.plan.indices
+        dct_flat = dct_y.reshape(-1)
+        coeffs = dct_flat[indices]
+        dct_flat[indices] = coeffs + self.alpha * self.watermark.reshape(-1)[indices] * np.abs(coeffs)
         
         watermarked_y = cv2.idct(dct_y)
         watermarked_y = np.uint8(np.clip(watermarked_y, 0, 255))
@@ -73,11 +162,128 @@ class WatermarkingSystem:
         
         return watermarked_bgr
     
-    # 提取水印
+    # 提取水印：设置了结果缓存时，以（密钥指纹, 图像内容）为键复用之前的提取结果
     def extract(self, watermarked_image: np.ndarray) -> np.ndarray:
-        if self.original_dct is None or self.watermark is None:
-            raise RuntimeError("请先嵌入水印再进行提取")
+        if self.cache is None:
+            return self._extract(watermarked_image)
+        
+        key = make_cache_key('extract', self.fingerprint(), watermarked_image)
+        extracted_watermark = self.cache.get_or_compute(
+            key, lambda: self._extract(watermarked_image).astype(np.int8)
+        )
+        return extracted_watermark.astype(np.float32)
+    
+    def _extract(self, watermarked_image: np.ndarray) -> np.ndarray:
+        valid, original_coeffs, scale = self._extraction_weights()
+        dct_y = self._watermarked_dct(watermarked_image)
+        
+        # 只对掩码内且原系数不接近0的位置求值，整体以数组运算完成，避免逐像素循环
+        extracted_watermark = np.zeros_like(self.watermark, dtype=np.float32)
+        extracted_flat = extracted_watermark.reshape(-1)
+        extracted_flat[valid] = (dct_y.reshape(-1)[valid] - original_coeffs) * scale
+        
+        extracted_watermark = np.sign(extracted_watermark)
+        return extracted_watermark
+    
+    # 批量提取水印：输入图像列表或(N, H, W, 3)数组，返回提取的水印及对应NCC
+    def extract_batch(self, watermarked_images) -> Tuple[np.ndarray, np.ndarray]:
+        valid, original_coeffs, scale = self._extraction_weights()
+        
+        count = len(watermarked_images)
+        extracted_coeffs = np.empty((count, original_coeffs.size), dtype=np.float32)
+        for index in range(count):
+            dct_y = self._watermarked_dct(watermarked_images[index])
+            extracted_coeffs[index] = dct_y.reshape(-1)[valid]
+        
+        # 掩码与分母对整批只计算一次，差分与符号判断一次性对整个(N, K)矩阵完成
+        extracted_coeffs -= original_coeffs
+        extracted_coeffs *= scale
+        np.sign(extracted_coeffs, out=extracted_coeffs)
+        
+        extracted_watermarks = np.zeros((count,) + self.watermark.shape, dtype=np.float32)
+        extracted_watermarks.reshape(count, -1)[:, valid] = extracted_coeffs
+        
+        ncc_values = self._batch_ncc(self.watermark.astype(np.float32), extracted_watermarks)
+        return extracted_watermarks, ncc_values
+    
+    # 提取所需的有效系数下标、对应原始系数及缩放因子 1 / (alpha * |C|)，每次嵌入或加载密钥后只计算一次
+    def _extraction_weights(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if self._weights is None:
+            if self.original_dct is not None and self._watermark is not None:
+                coeffs = self.original_dct.reshape(-1)[self.plan.indices]
+            elif self._key_path is not None:
+                coeffs = self._read_key()
+            else:
+                raise RuntimeError("请先嵌入水印再进行提取")
             
+            indices = self.plan.indices     # 选择中频区域嵌入水印
+            original_abs = np.abs(coeffs)
+            nonzero = original_abs > 1e-4
+            scale = 1.0 / (self.alpha * original_abs[nonzero])
+            self._weights = (indices[nonzero], coeffs[nonzero], scale)
+        return self._weights
+    
+    # 水印密钥指纹：由强度、尺寸、掩码内原始系数和水印确定，用作结果缓存键的一部分
+    def fingerprint(self) -> str:
+        if self._fingerprint is None:
+            valid, original_coeffs, _ = self._extraction_weights()
+            digest = hashlib.sha256()
+            digest.update(repr((self.alpha, self.original_shape)).encode())
+            digest.update(valid.tobytes())
+            digest.update(original_coeffs.tobytes())
+            digest.update(np.packbits(self.watermark.reshape(-1)[valid] > 0).tobytes())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+    
+    # 保存紧凑提取密钥(.npz)：只保存中频掩码内的原始系数（默认float16）和按位打包的 ±1 水印
+    def save_key(self, key_path: str, dtype=np.float16) -> None:
+        if self.original_dct is None or self.watermark is None:
+            raise RuntimeError("请先嵌入水印再保存密钥")
+        
+        indices = self.plan.indices
+        coeffs = self.original_dct.reshape(-1)[indices]
+        dtype = key_dtype(coeffs, dtype)
+        bits = np.packbits(self.watermark.reshape(-1)[indices] > 0)
+        
+        with open(key_path, 'wb') as key_file:
+            np.savez(
+                key_file,
+                shape=np.array(self.original_shape, dtype=np.int64),
+                alpha=np.float64(self.alpha),
+                coeffs=coeffs.astype(dtype),
+                bits=bits,
+            )
+    
+    # 加载提取密钥：此处只读取尺寸与强度，系数和水印在首次提取时才读入
+    def load_key(self, key_path: str) -> None:
+        with np.load(key_path) as key:
+            shape = tuple(int(v) for v in key['shape'])
+            alpha = float(key['alpha'])
+        
+        self.alpha = alpha
+        self.original_shape = shape
+        self.plan = get_embedding_plan(shape, alpha)
+        self.original_dct = None
+        self.watermark = None
+        self._weights = None
+        self._fingerprint = None
+        self._key_path = key_path
+    
+    # 读入密钥中的原始系数，并由打包的水印位还原 ±1 水印（掩码外为0）
+    def _read_key(self) -> np.ndarray:
+        with np.load(self._key_path) as key:
+            coeffs = key['coeffs'].astype(np.float32)
+            bits = key['bits']
+        
+        indices = self.plan.indices
+        watermark = np.zeros(self.original_shape, dtype=np.int8)
+        watermark.reshape(-1)[indices] = np.unpackbits(bits, count=indices.size).astype(np.int8) * 2 - 1
+        self.watermark = watermark
+        self._key_path = None
+        return coeffs
+    
+    # 将待检测图像对齐到原始尺寸，并返回其Y通道的DCT系数
+    def _watermarked_dct(self, watermarked_image: np.ndarray) -> np.ndarray:
         if watermarked_image.shape[:2] != self.original_shape:
             watermarked_image = cv2.resize(
                 watermarked_image, 
@@ -86,27 +292,25 @@ class WatermarkingSystem:
         
         watermarked_ycrcb = cv2.cvtColor(watermarked_image, cv2.COLOR_BGR2YCrCb)
         y, _, _ = cv2.split(watermarked_ycrcb)
+        return cv2.dct(np.float32(y))
+    
+    # 批量计算NCC，与calculate_ncc逐个计算的结果一致
+    @staticmethod
+    def _batch_ncc(original_watermark: np.ndarray, extracted_watermarks: np.ndarray) -> np.ndarray:
+        count = extracted_watermarks.shape[0]
+        original_flat = original_watermark.reshape(-1)
+        extracted_flat = extracted_watermarks.reshape(count, -1)
         
-        dct_y = cv2.dct(np.float32(y))
-        
-        height, width = dct_y.shape     # 选择中频区域嵌入水印
-        center_x, center_y = width // 2, height // 2
-        radius = min(center_x, center_y) // 2
-        
-        y_indices, x_indices = np.ogrid[:height, :width]
-        mask = ((x_indices - center_x)**2 + (y_indices - center_y)**2) <= radius**2
-        
-        extracted_watermark = np.zeros_like(self.watermark, dtype=np.float32)
-        
-        for i in range(height):
-            for j in range(width):
-                if mask[i, j]:
-                    if np.abs(self.original_dct[i, j]) > 1e-4:
-                        diff = dct_y[i, j] - self.original_dct[i, j]
-                        extracted_watermark[i, j] = diff / (self.alpha * np.abs(self.original_dct[i, j]))
+        valid = (extracted_flat != 0) & (original_flat != 0)
+        numerator = extracted_flat @ original_flat
+        orig_energy = valid @ (original_flat**2)
+        extr_energy = np.sum(extracted_flat**2 * (original_flat != 0), axis=1)
+        denominator = np.sqrt(orig_energy * extr_energy)
         
-        extracted_watermark = np.sign(extracted_watermark)
-        return extracted_watermark
+        ncc_values = np.zeros(count, dtype=np.float64)
+        nonzero = denominator > 1e-10   # 避免除以0
+        ncc_values[nonzero] = numerator[nonzero] / denominator[nonzero]
+        return ncc_values
     
     # 计算NCC
     def calculate_ncc(self, original_watermark: np.ndarray, extracted_watermark: np.ndarray) -> float:
@@ -1,6 +1,11 @@
+import os
+import mmap
 import secrets
+import tempfile
+import warnings
+from collections import OrderedDict
 from hashlib import sha256
-from gmssl import sm3, func
+from sm3_engine import SM3State, sm3_hash, sm3_hash_batch
 
 class SM2:
     # SM2椭圆曲线参数
@@ -61,21 +66,37 @@ class SM2:
     
     @staticmethod
     def extended_euclidean(a, b):
-        """扩展欧几里得算法，计算gcd和贝祖系数"""
-        if b == 0:
-            return (a, 1, 0)
-        else:
-            g, x, y = SM2.extended_euclidean(b, a % b)
-            return (g, y, x - (a // b) * y)
+        """扩展欧几里得算法，计算gcd和贝祖系数（迭代实现，不受递归深度影响）"""
+        x0, y0, x1, y1 = 1, 0, 0, 1
+        while b:
+            q, r = divmod(a, b)
+            a, b = b, r
+            x0, x1 = x1, x0 - q * x1
+            y0, y1 = y1, y0 - q * y1
+        return (a, x0, y0)
     
     @staticmethod
     def mod_inverse(a, n):
-        """计算模逆元，即满足(a * x) % n == 1的x值"""
-        g, x, y = SM2.extended_euclidean(a, n)
-        if g != 1:
-            raise ValueError("逆元不存在")
-        else:
-            return x % n
+        """计算模逆元，即满足(a * x) % n == 1的x值；使用内置 pow(a, -1, n)（C实现的扩展欧几里得）"""
+        try:
+            return pow(a, -1, n)
+        except ValueError:
+            raise ValueError("逆元不存在") from None
+    
+    @staticmethod
+    def batch_inverse(values, n):
+        """Montgomery批量求逆：用一次模逆和约3(k-1)次模乘求出k个非零值的逆元"""
+        prefix = []
+        acc = 1
+        for v in values:
+            prefix.append(acc)
+            acc = acc * v % n
+        inv = SM2.mod_inverse(acc, n)
+        result = [0] * len(values)
+        for i in range(len(values) - 1, -1, -1):
+            result[i] = prefix[i] * inv % n
+            inv = inv * values[i] % n
+        return result
     
     @staticmethod
     def elliptic_add(p, q):
@@ -108,26 +129,250 @@ class SM2:
         """椭圆曲线上的倍点运算"""
         return SM2.elliptic_add(p, p)
     
+    # 雅可比射影坐标 (X, Y, Z) 表示仿射点 (X/Z², Y/Z³)，Z = 0 表示无穷远点
+    INFINITY_J = (1, 1, 0)
+    
     @staticmethod
-    def elliptic_mult(k, p):
-        """椭圆曲线上的标量乘法，使用蒙哥马利梯子算法提高安全性"""
-        if k == 0:
+    def to_jacobian(p):
+        """仿射坐标转雅可比坐标"""
+        if p == 0:
+            return SM2.INFINITY_J
+        return (p[0], p[1], 1)
+    
+    @staticmethod
+    def from_jacobian(p):
+        """雅可比坐标转仿射坐标，只需一次模逆"""
+        X, Y, Z = p
+        if Z == 0:
             return 0
+        z_inv = SM2.mod_inverse(Z, SM2.Q)
+        z_inv2 = z_inv * z_inv % SM2.Q
+        return (X * z_inv2 % SM2.Q, Y * z_inv2 * z_inv % SM2.Q)
+    
+    @staticmethod
+    def normalize_jacobian(points):
+        """将一组雅可比坐标点统一转换为Z = 1的形式，所有点共用一次模逆"""
+        finite = [i for i, p in enumerate(points) if p[2] != 0]
+        z_invs = SM2.batch_inverse([points[i][2] for i in finite], SM2.Q)
+        result = list(points)
+        for i, z_inv in zip(finite, z_invs):
+            X, Y, _ = points[i]
+            z_inv2 = z_inv * z_inv % SM2.Q
+            result[i] = (X * z_inv2 % SM2.Q, Y * z_inv2 * z_inv % SM2.Q, 1)
+        return result
+    
+    @staticmethod
+    def jacobian_double(p):
+        """雅可比坐标下的倍点运算，无需模逆"""
+        X1, Y1, Z1 = p
+        if Z1 == 0 or Y1 == 0:
+            return SM2.INFINITY_J
+        q = SM2.Q
+        YY = Y1 * Y1 % q
+        S = 4 * X1 * YY % q
+        M = 3 * X1 * X1
+        if SM2.A:
+            Z1Z1 = Z1 * Z1 % q
+            M += SM2.A * Z1Z1 * Z1Z1
+        M %= q
+        X3 = (M * M - 2 * S) % q
+        Y3 = (M * (S - X3) - 8 * YY * YY) % q
+        Z3 = 2 * Y1 * Z1 % q
+        return (X3, Y3, Z3)
+    
+    @staticmethod
+    def jacobian_add(p, r):
+        """雅可比坐标下的点加法，无需模逆；r 的 Z = 1 时（混合加法）省去部分乘法"""
+        X1, Y1, Z1 = p
+        X2, Y2, Z2 = r
+        if Z1 == 0:
+            return r
+        if Z2 == 0:
+            return p
+        q = SM2.Q
+        Z1Z1 = Z1 * Z1 % q
+        U2 = X2 * Z1Z1 % q
+        S2 = Y2 * Z1 * Z1Z1 % q
+        if Z2 == 1:
+            U1, S1 = X1, Y1
+        else:
+            Z2Z2 = Z2 * Z2 % q
+            U1 = X1 * Z2Z2 % q
+            S1 = Y1 * Z2 * Z2Z2 % q
+            
+        if U1 == U2:
+            if S1 != S2:
+                return SM2.INFINITY_J
+            return SM2.jacobian_double(p)
+            
+        H = (U2 - U1) % q
+        R = (S2 - S1) % q
+        HH = H * H % q
+        HHH = H * HH % q
+        V = U1 * HH % q
+        X3 = (R * R - HHH - 2 * V) % q
+        Y3 = (R * (V - X3) - S1 * HHH) % q
+        Z3 = Z1 * H % q if Z2 == 1 else Z1 * Z2 * H % q
+        return (X3, Y3, Z3)
+    
+    @staticmethod
+    def elliptic_mult_jacobian(k, p):
+        """雅可比坐标下的蒙哥马利梯子标量乘法，返回雅可比坐标结果"""
+        if k == 0 or p == 0:
+            return SM2.INFINITY_J
             
         k_bin = bin(k)[2:]
-        r0 = 0
-        r1 = p
+        r0 = SM2.INFINITY_J
+        r1 = SM2.to_jacobian(p)
         
         for bit in k_bin:
             if bit == '0':
-                r1 = SM2.elliptic_add(r0, r1)
-                r0 = SM2.elliptic_double(r0)
+                r1 = SM2.jacobian_add(r0, r1)
+                r0 = SM2.jacobian_double(r0)
             else:
-                r0 = SM2.elliptic_add(r0, r1)
-                r1 = SM2.elliptic_double(r1)
+                r0 = SM2.jacobian_add(r0, r1)
+                r1 = SM2.jacobian_double(r1)
                 
         return r0
     
+    @staticmethod
+    def elliptic_mult(k, p):
+        """椭圆曲线上的标量乘法，使用蒙哥马利梯子算法提高安全性；
+        中间过程使用雅可比坐标，只在最后转换回仿射坐标时做一次模逆"""
+        return SM2.from_jacobian(SM2.elliptic_mult_jacobian(k, p))
+    
+    @staticmethod
+    def jacobian_neg(p):
+        """雅可比坐标下的取负"""
+        return (p[0], -p[1] % SM2.Q, p[2])
+    
+    @staticmethod
+    def wnaf(k, w):
+        """计算k的宽度为w的NAF表示（低位在前），非零位均为奇数且绝对值小于2^(w-1)，
+        任意w个相邻位中至多一个非零"""
+        digits = []
+        while k > 0:
+            if k & 1:
+                d = k & ((1 << w) - 1)
+                if d >= 1 << (w - 1):
+                    d -= 1 << w
+                k -= d
+            else:
+                d = 0
+            digits.append(d)
+            k >>= 1
+        return digits
+    
+    @staticmethod
+    def odd_multiples(p, w):
+        """预计算 P, 3P, 5P, ..., (2^(w-1)-1)P（雅可比坐标），供wNAF查表"""
+        base = SM2.to_jacobian(p)
+        double = SM2.jacobian_double(base)
+        table = [base]
+        for _ in range((1 << (w - 2)) - 1):
+            table.append(SM2.jacobian_add(table[-1], double))
+        return table
+    
+    @staticmethod
+    def multi_mult_jacobian(terms):
+        """Straus/Shamir交错wNAF多标量乘法，计算 Σ k_i·P_i（雅可比坐标）；
+        terms 为 (k, odd_multiples表, w) 列表，所有项共用同一串倍点。
+        运算次数依赖于标量取值，只能用于验签等公开数据"""
+        nafs = [(SM2.wnaf(k, w), table) for k, table, w in terms]
+        length = max((len(naf) for naf, _ in nafs), default=0)
+        acc = SM2.INFINITY_J
+        for i in range(length - 1, -1, -1):
+            acc = SM2.jacobian_double(acc)
+            for naf, table in nafs:
+                if i < len(naf) and naf[i]:
+                    d = naf[i]
+                    if d > 0:
+                        acc = SM2.jacobian_add(acc, table[d >> 1])
+                    else:
+                        acc = SM2.jacobian_add(acc, SM2.jacobian_neg(table[-d >> 1]))
+        return acc
+    
+    # 验签时G的wNAF窗口宽度：G的表只建一次，可以取得较宽的窗口
+    G_WNAF_WIDTH = 7
+    _g_wnaf_table = None
+    
+    @classmethod
+    def get_g_wnaf_table(cls):
+        """G的奇数倍表，转换为Z = 1的形式，使验签中的加法都走混合加法"""
+        if cls._g_wnaf_table is None:
+            cls._g_wnaf_table = cls.normalize_jacobian(cls.odd_multiples(cls.G, cls.G_WNAF_WIDTH))
+        return cls._g_wnaf_table
+    
+    @classmethod
+    def get_verifier(cls, ID, public_key):
+        """获取(ID, 公钥)对应的验签上下文，最近使用的 VERIFIER_CACHE_SIZE 个上下文会被缓存"""
+        return _get_verifiers([(ID, tuple(public_key))])[0]
+    
+    # 生成元G的固定基点预计算表，每个进程只构建（或从文件加载）一次
+    _g_table = None
+    
+    @classmethod
+    def get_g_table(cls):
+        """获取G的固定基点表：设置了环境变量SM2_G_TABLE时从该文件加载，文件不存在则构建后写入"""
+        if cls._g_table is None:
+            path = os.environ.get('SM2_G_TABLE')
+            if path and os.path.exists(path):
+                try:
+                    cls._g_table = FixedBaseTable.load(path, cls.G)
+                except ValueError as e:
+                    # 文件损坏、被截断或被篡改：不使用其中的点，重新构建并覆盖
+                    warnings.warn(f"忽略无效的固定基点表文件：{e}")
+            if cls._g_table is None:
+                cls._g_table = FixedBaseTable(cls.G)
+                if path:
+                    cls._g_table.save(path)
+        return cls._g_table
+    
+    @classmethod
+    def base_mult_jacobian(cls, k):
+        """计算k·G（雅可比坐标），使用固定基点表"""
+        return cls.get_g_table().mult_jacobian(k)
+    
+    @classmethod
+    def base_mult(cls, k):
+        """计算k·G（仿射坐标），使用固定基点表"""
+        return cls.from_jacobian(cls.base_mult_jacobian(k))
+    
+    @staticmethod
+    def compress_point(p):
+        """点的压缩编码：1字节前缀（y为偶数0x02、奇数0x03）+ 32字节x坐标，共33字节"""
+        x, y = p
+        return bytes([2 | (y & 1)]) + x.to_bytes(32, 'big')
+    
+    @staticmethod
+    def decompress_point(data):
+        """由33字节压缩编码恢复点，q ≡ 3 (mod 4) 时平方根只需一次模幂"""
+        if len(data) != 33 or data[0] not in (2, 3):
+            raise ValueError("不是合法的压缩点编码")
+        q = SM2.Q
+        x = int.from_bytes(data[1:], 'big')
+        if x >= q:
+            raise ValueError("x坐标超出范围")
+        rhs = (x * x * x + SM2.A * x + SM2.B) % q
+        y = pow(rhs, (q + 1) // 4, q) if q % 4 == 3 else SM2.tonelli_shanks(rhs, q)
+        if y * y % q != rhs:
+            raise ValueError("x坐标不在曲线上")
+        if (y & 1) != (data[0] & 1):
+            y = q - y
+        return (x, y)
+    
+    @staticmethod
+    def encode_signature(signature):
+        """签名编码为64字节 r || s"""
+        r, s = signature
+        return r.to_bytes(32, 'big') + s.to_bytes(32, 'big')
+    
+    @staticmethod
+    def decode_signature(data):
+        if len(data) != 64:
+            raise ValueError("签名编码长度应为64字节")
+        return (int.from_bytes(data[:32], 'big'), int.from_bytes(data[32:], 'big'))
+    
     @staticmethod
     def get_bit_num(x):
         """获取数值的二进制位数"""
@@ -151,35 +396,52 @@ class SM2:
         ENTL = str(SM2.get_bit_num(ID))
         
         t = ENTL + ID + a_str + b_str + G_X_str + G_Y_str + x_A_str + y_A_str
-        t_bytes = t.encode('utf-8')
-        digest = sm3.sm3_hash(func.bytes_to_list(t_bytes))
-        return int(digest, 16)
+        return int.from_bytes(sm3_hash(t.encode('utf-8')), 'big')
     
     @classmethod
     def generate_key(cls):
         """生成SM2公私钥对"""
         while True:
             private_key = secrets.randbelow(cls.N - 1) + 1
-            public_key = cls.elliptic_mult(private_key, cls.G)
+            public_key = cls.base_mult(private_key)
             if public_key != 0:  # 确保公钥不是无穷远点
                 return private_key, public_key
     
+    @classmethod
+    def generate_keys(cls, count):
+        """批量生成count个SM2公私钥对，全部公钥共用一次模逆转换为仿射坐标"""
+        private_keys = [secrets.randbelow(cls.N - 1) + 1 for _ in range(count)]
+        points = cls.normalize_jacobian([cls.base_mult_jacobian(d) for d in private_keys])
+        return [(d, p[:2]) for d, p in zip(private_keys, points)]
+    
     @classmethod
     def sign(cls, private_key, message, Z_A, user_id="1234567812345678"):
-        """SM2签名算法"""
-        if not isinstance(message, str):
-            message = str(message)
-            
+        """SM2签名算法：message 可以是 str（按UTF-8编码）或 bytes 类对象，与 verify 的消息哈希一致"""
         # 计算e = H(Z_A || M)
-        M = str(Z_A) + message
-        M_bytes = M.encode('utf-8')
-        e = sm3.sm3_hash(func.bytes_to_list(M_bytes))
-        e = int(e, 16)
-        
+        e = cls.message_digest(Z_A, message)
+        return cls.sign_digest(private_key, e)
+    
+    @classmethod
+    def sign_stream(cls, private_key, data, Z_A, chunk_size=None):
+        """流式签名：data 可以是 bytes、以二进制方式打开的文件对象或产出 bytes 的迭代器，
+        按块增量计算 e = H(Z_A || M)，内存占用与消息长度无关"""
+        return cls.sign_digest(private_key, cls.message_digest(Z_A, data, chunk_size))
+    
+    @staticmethod
+    def message_digest(Z_A, data, chunk_size=None):
+        """计算e = H(Z_A || M)，str 按UTF-8编码，与 sign、verify 的消息哈希一致"""
+        state = SM3State(str(Z_A).encode('utf-8'))
+        for chunk in iter_chunks(data, chunk_size):
+            state.update(chunk)
+        return state.digest_int()
+    
+    @classmethod
+    def sign_digest(cls, private_key, e):
+        """对已计算好的 e = H(Z_A || M) 签名"""
         # 生成随机数k
         while True:
             k = secrets.randbelow(cls.N - 1) + 1
-            random_point = cls.elliptic_mult(k, cls.G)
+            random_point = cls.base_mult(k)
             x1 = random_point[0]
             r = (e + x1) % cls.N
             if r == 0 or r + k == cls.N:
@@ -193,38 +455,304 @@ class SM2:
     
     @classmethod
     def verify(cls, public_key, ID, message, signature):
-        """SM2签名验证算法"""
+        """SM2签名验证算法，Z_A及公钥的预计算表从验签上下文缓存中获取"""
+        return cls.get_verifier(ID, public_key).verify(message, signature)
+    
+    @classmethod
+    def verify_stream(cls, public_key, ID, data, signature, chunk_size=None):
+        """流式验签，data 的形式与 sign_stream 相同"""
+        context = cls.get_verifier(ID, public_key)
+        return context.verify_digest(context.digest(data, chunk_size), signature)
+    
+    @classmethod
+    def verify_batch(cls, items):
+        """批量验签：items 为 (public_key, ID, message, signature) 序列，返回与之一一对应的验证结果列表。
+        这只是逐条验签的便捷封装，每条签名的代价与热缓存下的单条 verify 相当，没有“全部有效时”的快速路径：
+        SM2 签名只携带 r，R 只能确定 x 坐标（至多两个候选），y 的符号未知，
+        无法把多条签名合并成一次随机线性组合检查（m 条签名需要尝试 2^m 种符号组合）。
+        共享的只有与签名无关的部分：按签名者分组复用验签上下文，批次中新出现的签名者的预计算表共用一次模逆构建，
+        全部消息哈希由 sm3_hash_batch 多路并行计算"""
+        items = list(items)
+        keys = [(ID, tuple(public_key)) for public_key, ID, _, _ in items]
+        signers = list(dict.fromkeys(keys))
+        contexts = dict(zip(signers, _get_verifiers(signers)))
+        digests = sm3_hash_batch(contexts[key].prefix_bytes + b''.join(iter_chunks(message))
+                                 for key, (_, _, message, _) in zip(keys, items))
+        return [contexts[key].verify_digest(int.from_bytes(digest, 'big'), signature)
+                for key, digest, (_, _, _, signature) in zip(keys, digests, items)]
+
+
+class FixedBaseTable:
+    """固定基点窗口表：对窗口宽度w，第i个窗口预存 (j+1)·2^(w·i)·P (j = 0..2^w-1) 的仿射坐标。
+    k·P = Σ T[i][k_i] - Σ 2^(w·i)·P，每个窗口都固定做一次混合加法（不出现零窗口的跳过），
+    整个过程没有倍点，运算次数与标量取值无关"""
+    MAGIC = b'SM2FBT2\0'
+    
+    def __init__(self, point, window=4, table=None):
+        self.point = point
+        self.window = window
+        self.windows = (SM2.N.bit_length() + window - 1) // window
+        self.table = table if table is not None else self._build()
+        
+        # 修正项：-(Σ 2^(w·i))·P，用于抵消每个窗口多加的一倍基点
+        offset = sum(1 << (window * i) for i in range(self.windows)) % SM2.N
+        self.correction = SM2.to_jacobian(SM2.elliptic_mult(SM2.N - offset, point))
+    
+    def _build(self):
+        size = 1 << self.window
+        points = []
+        base = SM2.to_jacobian(self.point)
+        for _ in range(self.windows):
+            acc = base
+            for _ in range(size):
+                points.append(acc)
+                acc = SM2.jacobian_add(acc, base)
+            for _ in range(self.window):
+                base = SM2.jacobian_double(base)
+        # 全部表项共用一次模逆转换为仿射坐标
+        points = [p[:2] for p in SM2.normalize_jacobian(points)]
+        return [points[i * size:(i + 1) * size] for i in range(self.windows)]
+    
+    def mult_jacobian(self, k):
+        """计算k·P，返回雅可比坐标"""
+        k %= SM2.N
+        if k == 0:
+            return SM2.INFINITY_J
+        mask = (1 << self.window) - 1
+        acc = self.correction
+        for i in range(self.windows):
+            acc = SM2.jacobian_add(acc, SM2.to_jacobian(self.table[i][(k >> (self.window * i)) & mask]))
+        return acc
+    
+    def mult(self, k):
+        return SM2.from_jacobian(self.mult_jacobian(k))
+    
+    def save(self, path):
+        """序列化为二进制文件：魔数、窗口宽度，然后按顺序存放每个点的x、y（各32字节大端），
+        最后是前面全部内容的SHA-256摘要。先写入同目录下的临时文件再原子替换，
+        其他进程（如正在导入模块的工作进程）不会读到写了一半的文件"""
+        data = bytearray(self.MAGIC)
+        data.append(self.window)
+        for row in self.table:
+            for x, y in row:
+                data += x.to_bytes(32, 'big')
+                data += y.to_bytes(32, 'big')
+        data += sha256(data).digest()
+        
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    
+    @classmethod
+    def load(cls, path, point):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if not data.startswith(cls.MAGIC):
+            raise ValueError(f"{path} 不是固定基点表文件")
+        if len(data) < len(cls.MAGIC) + 1 + 32:
+            raise ValueError(f"{path} 长度不足")
+        content, digest = data[:-32], data[-32:]
+        if sha256(content).digest() != digest:
+            raise ValueError(f"{path} 摘要校验失败，文件已损坏或被截断")
+        window = content[len(cls.MAGIC)]
+        if not 1 <= window <= 8:
+            raise ValueError(f"{path} 中的窗口宽度 {window} 无效")
+        size = 1 << window
+        windows = (SM2.N.bit_length() + window - 1) // window
+        body = memoryview(content)[len(cls.MAGIC) + 1:]
+        if len(body) != windows * size * 64:
+            raise ValueError(f"{path} 长度与窗口宽度 {window} 不符")
+        
+        coords = [int.from_bytes(body[i:i + 32], 'big') for i in range(0, len(body), 32)]
+        points = list(zip(coords[0::2], coords[1::2]))
+        # 摘要只能发现意外损坏；逐点检查在曲线上，避免被替换的表把运算引到曲线之外
+        q = SM2.Q
+        for x, y in points:
+            if x >= q or y >= q or (y * y - x * x * x - SM2.A * x - SM2.B) % q != 0:
+                raise ValueError(f"{path} 中存在不在曲线上的点")
+        table = [points[i * size:(i + 1) * size] for i in range(windows)]
+        if table[0][0] != tuple(point):
+            raise ValueError(f"{path} 中的表与基点不匹配")
+        return cls(point, window, table)
+
+
+# 流式哈希时每次从文件对象读取的字节数
+CHUNK_SIZE = 1 << 20
+
+
+def iter_chunks(data, chunk_size=None):
+    """将消息统一拆成 bytes 块：str 按UTF-8编码，bytes类对象整体产出，
+    带 read 方法的文件对象按 chunk_size 分块读取，其余视为产出 bytes 的可迭代对象"""
+    if isinstance(data, str):
+        yield data.encode('utf-8')
+    elif isinstance(data, (bytes, bytearray, memoryview)):
+        yield data
+    elif hasattr(data, 'read'):
+        chunk_size = chunk_size or CHUNK_SIZE
+        while True:
+            chunk = data.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        for chunk in data:
+            yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+
+class VerifierContext:
+    """单个(ID, 公钥)的验签上下文：预先计算Z_A、吸收Z_A后的SM3状态和公钥的wNAF奇数倍表，
+    同一签名者的重复验签只需计算消息哈希和标量乘法"""
+    # 表会被缓存复用，因此比单次验签取更宽的窗口，并统一转换为Z = 1的形式
+    WIDTH = 6
+    
+    def __init__(self, ID, public_key, table=None):
+        self.ID = ID
+        self.public_key = public_key
+        self.Z_A = SM2.pre_compute(ID, SM2.A, SM2.B, SM2.G_X, SM2.G_Y, public_key[0], public_key[1])
+        self.prefix_bytes = str(self.Z_A).encode('utf-8')
+        self.prefix = SM3State(self.prefix_bytes)
+        self.table = table if table is not None else self.build_tables([public_key])[0]
+    
+    @classmethod
+    def build_tables(cls, public_keys):
+        """为多个公钥构建奇数倍表，全部点的归一化共用一次模逆"""
+        size = 1 << (cls.WIDTH - 2)
+        points = [p for public_key in public_keys for p in SM2.odd_multiples(public_key, cls.WIDTH)]
+        points = SM2.normalize_jacobian(points)
+        return [points[i:i + size] for i in range(0, len(points), size)]
+    
+    def digest(self, data, chunk_size=None):
+        """计算e = H(Z_A || M)，data 的形式与 SM2.sign_stream 相同"""
+        state = self.prefix.copy()
+        for chunk in iter_chunks(data, chunk_size):
+            state.update(chunk)
+        return state.digest_int()
+    
+    def verify(self, message, signature):
+        return self.verify_digest(self.digest(message), signature)
+    
+    def verify_digest(self, e, signature):
         r, s = signature
+        N = SM2.N
         
         # 验证r和s的范围
-        if not (1 <= r <= cls.N - 1 and 1 <= s <= cls.N - 1):
+        if not (1 <= r <= N - 1 and 1 <= s <= N - 1):
             return False
-            
-        # 计算Z_A
-        Z = cls.pre_compute(ID, cls.A, cls.B, cls.G_X, cls.G_Y, public_key[0], public_key[1])
-        
-        # 计算e = H(Z || M)
-        M = str(Z) + message
-        M_bytes = M.encode('utf-8')
-        e = sm3.sm3_hash(func.bytes_to_list(M_bytes))
-        e = int(e, 16)
         
-        t = (r + s) % cls.N
+        t = (r + s) % N
         if t == 0:
             return False
-            
-        # 计算sG + tP
-        point1 = cls.elliptic_mult(s, cls.G)
-        point2 = cls.elliptic_mult(t, public_key)
-        point = cls.elliptic_add(point1, point2)
         
-        if point == 0:
+        # 计算sG + tP（共用倍点的交错wNAF）
+        X, _, Z = SM2.multi_mult_jacobian([
+            (s, SM2.get_g_wnaf_table(), SM2.G_WNAF_WIDTH),
+            (t, self.table, self.WIDTH),
+        ])
+        if Z == 0:
             return False
-            
-        x1 = point[0]
-        R = (e + x1) % cls.N
         
-        return R == r
+        # R = (e + x1) mod n == r 等价于 x1 ≡ r - e (mod n)，而 x1 < q < 2n，候选值至多两个；
+        # 直接与 X / Z² 比较，无需模逆
+        ZZ = Z * Z % SM2.Q
+        x1 = (r - e) % N
+        while x1 < SM2.Q:
+            if X == x1 * ZZ % SM2.Q:
+                return True
+            x1 += N
+        return False
+
+
+class PublicKeyStore:
+    """公钥容器：每个公钥以33字节压缩编码连续存放在一块字节缓冲区中，
+    文件可直接内存映射，访问时才解压为点，百万级公钥只占约33 MB"""
+    RECORD_SIZE = 33
+    
+    def __init__(self, data=b''):
+        if len(data) % self.RECORD_SIZE:
+            raise ValueError("数据长度不是33字节的整数倍")
+        self.data = data
+        self._mmap = None
+    
+    @classmethod
+    def from_points(cls, points):
+        return cls(b''.join(SM2.compress_point(p) for p in points))
+    
+    @classmethod
+    def load(cls, path):
+        """以只读方式内存映射 save 写出的文件，不把内容读入内存"""
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return cls()
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        store = cls(memoryview(mapped))
+        store._mmap = mapped
+        return store
+    
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.data)
+    
+    def close(self):
+        if self._mmap is not None:
+            self.data.release()
+            self._mmap.close()
+            self._mmap = None
+            self.data = b''
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def __len__(self):
+        return len(self.data) // self.RECORD_SIZE
+    
+    def raw(self, index):
+        """第index个公钥的33字节压缩编码"""
+        if not -len(self) <= index < len(self):
+            raise IndexError("公钥下标超出范围")
+        index %= len(self)
+        return bytes(self.data[index * self.RECORD_SIZE:(index + 1) * self.RECORD_SIZE])
+    
+    def __getitem__(self, index):
+        return SM2.decompress_point(self.raw(index))
+    
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+# 验签上下文的LRU缓存，键为 (ID, 公钥)
+VERIFIER_CACHE_SIZE = 4096
+_verifiers = OrderedDict()
+
+
+def _get_verifiers(keys):
+    """按顺序返回各 (ID, 公钥) 的验签上下文，缓存中没有的一起构建"""
+    missing = [key for key in keys if key not in _verifiers]
+    if missing:
+        tables = VerifierContext.build_tables([public_key for _, public_key in missing])
+        for (ID, public_key), table in zip(missing, tables):
+            _verifiers[(ID, public_key)] = VerifierContext(ID, public_key, table)
+    contexts = []
+    for key in keys:
+        _verifiers.move_to_end(key)
+        contexts.append(_verifiers[key])
+    while len(_verifiers) > VERIFIER_CACHE_SIZE:
+        _verifiers.popitem(last=False)
+    return contexts
+
+
+# 指定了表文件时在导入阶段就加载（或构建并写入），避免首次签名时才付出构建开销
+if os.environ.get('SM2_G_TABLE'):
+    SM2.get_g_table()
+
 
 if __name__ == '__main__':
     # 生成密钥对
@@ -244,4 +772,12 @@ if __name__ == '__main__':
     
     # 验证
     valid = SM2.verify(public_key, ID, message, signature)
-    print(f"验证结果: {'通过' if valid else '失败'}")
\ No newline at end of file
+    print(f"验证结果: {'通过' if valid else '失败'}")
+    
+    # bytes 消息按原始字节签名和验证，两端的消息哈希一致
+    raw_message = message.encode('utf-8')
+    raw_signature = SM2.sign(private_key, raw_message, Z_A, ID)
+    assert SM2.verify(public_key, ID, raw_message, raw_signature), "bytes 消息验签失败"
+    assert SM2.verify(public_key, ID, message, raw_signature), "同一消息的 str 与 bytes 形式应得到相同摘要"
+    assert not SM2.verify(public_key, ID, repr(raw_message), raw_signature)
+    print("bytes 消息验证结果: 通过")
\ No newline at end of file
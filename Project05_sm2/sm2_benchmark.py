@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import platform
+import argparse
+from concurrent.futures import FIRST_COMPLETED, wait
+from sm2_02 import SM2
+from sm2_pool import SM2WorkerPool
+
+ID = "1234567812345678"
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def _latencies(submit, requests, concurrency):
+    """闭环测量单个请求的延迟：始终保持 concurrency 个请求在途，返回每个请求从提交到完成的耗时"""
+    start_times = {}
+    latencies = []
+    pending = set()
+    for request in requests:
+        if len(pending) >= concurrency:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            latencies.extend(time.perf_counter() - start_times.pop(f) for f in done)
+        future = submit(*request)
+        start_times[future] = time.perf_counter()
+        pending.add(future)
+    done, _ = wait(pending)
+    latencies.extend(time.perf_counter() - start_times.pop(f) for f in done)
+    return latencies
+
+
+def bench_workers(workers, operations, batch_size):
+    """测试一种进程数：批量接口的吞吐量，以及逐个提交时的 p50/p99 延迟"""
+    private_key, public_key = SM2.generate_key()
+    Z_A = SM2.pre_compute(ID, SM2.A, SM2.B, SM2.G_X, SM2.G_Y, public_key[0], public_key[1])
+    messages = [f"message {i}" for i in range(operations)]
+    sign_requests = [(private_key, message, Z_A, ID) for message in messages]
+
+    results = []
+    with SM2WorkerPool(workers, batch_size) as pool:
+        pool.generate_keys(workers)     # 预热：等待全部工作进程启动完成
+
+        start = time.perf_counter()
+        signatures = pool.sign_many(sign_requests)
+        sign_time = time.perf_counter() - start
+
+        verify_items = [(public_key, ID, message, signature) for message, signature in zip(messages, signatures)]
+        start = time.perf_counter()
+        valid = pool.verify_many(verify_items)
+        verify_time = time.perf_counter() - start
+        if not all(valid):
+            raise RuntimeError("验签失败，基准结果无效")
+
+        start = time.perf_counter()
+        pool.generate_keys(operations)
+        keygen_time = time.perf_counter() - start
+
+        latency_count = max(operations // 4, 1)
+        sign_latencies = _latencies(pool.submit_sign, sign_requests[:latency_count], workers)
+        verify_latencies = _latencies(pool.submit_verify, verify_items[:latency_count], workers)
+
+    for op, elapsed, latencies in (('sign', sign_time, sign_latencies),
+                                   ('verify', verify_time, verify_latencies),
+                                   ('generate_key', keygen_time, None)):
+        result = {'workers': workers, 'op': op, 'operations': operations,
+                  'ops_per_sec': operations / elapsed}
+        if latencies:
+            result['p50_ms'] = _percentile(latencies, 50) * 1000
+            result['p99_ms'] = _percentile(latencies, 99) * 1000
+        results.append(result)
+    return results
+
+
+def run_benchmarks(worker_counts, operations=400, batch_size=64):
+    results = []
+    for workers in worker_counts:
+        results.extend(bench_workers(workers, operations, batch_size))
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'operations': operations,
+            'batch_size': batch_size,
+        },
+        'results': results,
+    }
+
+
+def print_table(report):
+    print(f"{'进程数':>6} {'操作':<14} {'ops/s':>10} {'p50(ms)':>10} {'p99(ms)':>10}")
+    for r in report['results']:
+        p50 = f"{r['p50_ms']:10.2f}" if 'p50_ms' in r else f"{'-':>10}"
+        p99 = f"{r['p99_ms']:10.2f}" if 'p99_ms' in r else f"{'-':>10}"
+        print(f"{r['workers']:>6} {r['op']:<14} {r['ops_per_sec']:10.1f} {p50} {p99}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SM2多进程签名/验签吞吐量与延迟基准测试")
+    cpu_count = os.cpu_count() or 1
+    default_workers = sorted({1, 2, 4, cpu_count} & set(range(1, cpu_count + 1)))
+    parser.add_argument('--workers', type=int, nargs='*', default=default_workers, help="要测试的进程数")
+    parser.add_argument('--operations', type=int, default=400, help="每种操作的请求数")
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--output', default='sm2_benchmark_results.json', help="结果JSON输出路径")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.workers, args.operations, args.batch_size)
+    print_table(report)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"结果已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from sm2_02 import SM2
+
+
+def _init_worker(g_table, g_wnaf_table):
+    """工作进程初始化：直接使用主进程构建好的预计算表，不在每个进程里重新构建"""
+    SM2._g_table = g_table
+    SM2._g_wnaf_table = g_wnaf_table
+
+
+def _sign_batch(requests):
+    return [SM2.sign(private_key, message, Z_A, user_id) for private_key, message, Z_A, user_id in requests]
+
+
+def _verify_batch(items):
+    return SM2.verify_batch(items)
+
+
+def _generate_keys(count):
+    return SM2.generate_keys(count)
+
+
+def _chunks(items, size):
+    items = list(items)
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class _Coalescer:
+    """把逐个提交的请求合并成批：攒满 batch_size 条，或第一条到达后等待 delay 秒，即作为一个任务提交。
+    每个请求得到自己的 Future，结果为该批返回列表中的对应元素"""
+    def __init__(self, pool, func, batch_size, delay):
+        self._pool = pool
+        self._func = func
+        self._batch_size = batch_size
+        self._delay = delay
+        self._lock = threading.Lock()
+        self._items = []
+        self._futures = []
+        self._timer = None
+
+    def submit(self, item):
+        future = Future()
+        batch = None
+        with self._lock:
+            self._items.append(item)
+            self._futures.append(future)
+            if len(self._items) >= self._batch_size:
+                batch = self._take()
+            elif self._timer is None:
+                self._timer = threading.Timer(self._delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if batch is not None:
+            self._dispatch(*batch)
+        return future
+
+    def flush(self):
+        """立即提交当前攒下的请求"""
+        with self._lock:
+            batch = self._take() if self._items else None
+        if batch is not None:
+            self._dispatch(*batch)
+
+    def _take(self):
+        batch = (self._items, self._futures)
+        self._items, self._futures = [], []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        return batch
+
+    def _dispatch(self, items, futures):
+        # 已被调用方取消的请求仍随批计算，结果丢弃
+        futures = [future if future.set_running_or_notify_cancel() else None for future in futures]
+        try:
+            batch_future = self._pool.submit(self._func, items)
+        except Exception as e:     # 进程池已关闭等
+            for future in futures:
+                if future is not None:
+                    future.set_exception(e)
+            return
+
+        def done(batch_future):
+            error = batch_future.exception()
+            results = [error] * len(futures) if error is not None else batch_future.result()
+            for future, result in zip(futures, results):
+                if future is None:
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+        batch_future.add_done_callback(done)
+
+
+class SM2WorkerPool:
+    """多进程SM2签名/验签/密钥生成：*_many 与 generate_keys 将请求按 batch_size 分批提交到进程池；
+    submit_sign/submit_verify 及对应的 *_async 逐个提交的请求先合并，攒满 batch_size 条
+    或第一条等待 delay 秒后作为一批提交，单个请求的延迟最多增加 delay。
+    G的预计算表在启动时随初始化参数发送给每个工作进程一次"""
+    def __init__(self, workers=None, batch_size=64, delay=0.002):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                         initargs=(SM2.get_g_table(), SM2.get_g_wnaf_table()))
+        self._signer = _Coalescer(self._pool, _sign_batch, batch_size, delay)
+        self._verifier = _Coalescer(self._pool, _verify_batch, batch_size, delay)
+
+    def close(self):
+        # 先提交尚在合并中的请求，再等待全部任务完成
+        self._signer.flush()
+        self._verifier.flush()
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # 单个请求：返回 concurrent.futures.Future，结果分别为签名 (r, s)、验证结果 bool 以及密钥对列表；
+    # 签名和验签请求经合并后成批提交
+    def submit_sign(self, private_key, message, Z_A, user_id="1234567812345678"):
+        return self._signer.submit((private_key, message, Z_A, user_id))
+
+    def submit_verify(self, public_key, ID, message, signature):
+        return self._verifier.submit((public_key, ID, message, signature))
+
+    def submit_generate_keys(self, count):
+        return self._pool.submit(_generate_keys, count)
+
+    # 批量请求：requests 为 (private_key, message, Z_A, user_id) 序列，结果与输入顺序一致
+    def sign_many(self, requests):
+        futures = [self._pool.submit(_sign_batch, chunk) for chunk in _chunks(requests, self.batch_size)]
+        return [signature for future in futures for signature in future.result()]
+
+    # items 为 (public_key, ID, message, signature) 序列，每批在工作进程内走 SM2.verify_batch
+    def verify_many(self, items):
+        futures = [self._pool.submit(_verify_batch, chunk) for chunk in _chunks(items, self.batch_size)]
+        return [valid for future in futures for valid in future.result()]
+
+    def generate_keys(self, count):
+        sizes = [min(self.batch_size, count - start) for start in range(0, count, self.batch_size)]
+        futures = [self._pool.submit(_generate_keys, size) for size in sizes]
+        return [key_pair for future in futures for key_pair in future.result()]
+
+    # asyncio 接口：在事件循环中等待，不阻塞其他协程；sign_async/verify_async 与 submit_* 一样经合并后提交
+    async def sign_async(self, private_key, message, Z_A, user_id="1234567812345678"):
+        return await asyncio.wrap_future(self.submit_sign(private_key, message, Z_A, user_id))
+
+    async def verify_async(self, public_key, ID, message, signature):
+        return await asyncio.wrap_future(self.submit_verify(public_key, ID, message, signature))
+
+    async def sign_many_async(self, requests):
+        futures = [asyncio.wrap_future(self._pool.submit(_sign_batch, chunk))
+                   for chunk in _chunks(requests, self.batch_size)]
+        return [signature for chunk in await asyncio.gather(*futures) for signature in chunk]
+
+    async def verify_many_async(self, items):
+        futures = [asyncio.wrap_future(self._pool.submit(_verify_batch, chunk))
+                   for chunk in _chunks(items, self.batch_size)]
+        return [valid for chunk in await asyncio.gather(*futures) for valid in chunk]
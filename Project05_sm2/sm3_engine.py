@@ -0,0 +1,202 @@
+import struct
+
+try:
+    import numpy as np
+except ImportError:     # 没有 NumPy 时批量模式退化为逐条计算
+    np = None
+
+# SM3初始向量
+IV = (0x7380166f, 0x4914b2b9, 0x172442d7, 0xda8a0600,
+      0xa96f30bc, 0x163138aa, 0xe38dee4d, 0xb0fb0e4e)
+
+MASK = 0xFFFFFFFF
+
+
+def rotl(x, n):
+    """32位循环左移"""
+    return ((x << n) | (x >> (32 - n))) & MASK
+
+
+# 预先计算每轮的 T_j <<< (j mod 32)，压缩时不再重复移位
+T_ROT = tuple(rotl(0x79cc4519 if j < 16 else 0x7a879d8a, j % 32) for j in range(64))
+
+# 批量模式中，同一分组数的消息少于该数量时逐条计算更快（NumPy每轮的固定开销较大）
+MIN_LANES = 16
+
+_BLOCK = struct.Struct('>16I')
+_DIGEST = struct.Struct('>8I')
+
+
+def _expand(w):
+    """消息扩展：W0..W67，W'j = Wj ^ Wj+4 在压缩时现算"""
+    for j in range(16, 68):
+        x = w[j - 16] ^ w[j - 9]
+        y = w[j - 3]
+        x ^= ((y << 15) | (y >> 17)) & MASK
+        y = w[j - 13]
+        w.append(x ^ (((x << 15) | (x >> 17)) & MASK) ^ (((x << 23) | (x >> 9)) & MASK)
+                 ^ (((y << 7) | (y >> 25)) & MASK) ^ w[j - 6])
+    return w
+
+
+def compress(v, block):
+    """压缩函数：v 为8个32位字的状态，block 为64字节分组（bytes或memoryview）"""
+    w = _expand(list(_BLOCK.unpack(block)))
+    a, b, c, d, e, f, g, h = v
+
+    # 前16轮与后48轮的布尔函数不同，拆成两个循环避免轮内分支
+    for j in range(16):
+        a12 = ((a << 12) | (a >> 20)) & MASK
+        ss1 = (a12 + e + T_ROT[j]) & MASK
+        ss1 = ((ss1 << 7) | (ss1 >> 25)) & MASK
+        tt1 = ((a ^ b ^ c) + d + (ss1 ^ a12) + (w[j] ^ w[j + 4])) & MASK
+        tt2 = ((e ^ f ^ g) + h + ss1 + w[j]) & MASK
+        d = c
+        c = ((b << 9) | (b >> 23)) & MASK
+        b = a
+        a = tt1
+        h = g
+        g = ((f << 19) | (f >> 13)) & MASK
+        f = e
+        e = tt2 ^ (((tt2 << 9) | (tt2 >> 23)) & MASK) ^ (((tt2 << 17) | (tt2 >> 15)) & MASK)
+    for j in range(16, 64):
+        a12 = ((a << 12) | (a >> 20)) & MASK
+        ss1 = (a12 + e + T_ROT[j]) & MASK
+        ss1 = ((ss1 << 7) | (ss1 >> 25)) & MASK
+        tt1 = (((a & b) | (a & c) | (b & c)) + d + (ss1 ^ a12) + (w[j] ^ w[j + 4])) & MASK
+        tt2 = (((e & f) | (~e & g)) + h + ss1 + w[j]) & MASK
+        d = c
+        c = ((b << 9) | (b >> 23)) & MASK
+        b = a
+        a = tt1
+        h = g
+        g = ((f << 19) | (f >> 13)) & MASK
+        f = e
+        e = tt2 ^ (((tt2 << 9) | (tt2 >> 23)) & MASK) ^ (((tt2 << 17) | (tt2 >> 15)) & MASK)
+
+    return (v[0] ^ a, v[1] ^ b, v[2] ^ c, v[3] ^ d,
+            v[4] ^ e, v[5] ^ f, v[6] ^ g, v[7] ^ h)
+
+
+def _padding(length):
+    """长度为 length 字节的消息末尾需要追加的填充"""
+    return b'\x80' + b'\x00' * ((55 - length) % 64) + (length * 8).to_bytes(8, 'big')
+
+
+class SM3State:
+    """增量SM3：直接处理 bytes/memoryview，按64字节分组逐块压缩，
+    可复制当前状态，用于缓存吸收Z_A之后的中间状态"""
+    def __init__(self, data=b''):
+        self.v = IV
+        self.buffer = b''
+        self.length = 0
+        if data:
+            self.update(data)
+
+    def update(self, data):
+        data = memoryview(data).cast('B')     # 切片不复制数据
+        self.length += len(data)
+        if self.buffer:
+            need = 64 - len(self.buffer)
+            self.buffer += bytes(data[:need])
+            data = data[need:]
+            if len(self.buffer) < 64:
+                return self
+            self.v = compress(self.v, self.buffer)
+            self.buffer = b''
+        full = len(data) - len(data) % 64
+        for i in range(0, full, 64):
+            self.v = compress(self.v, data[i:i + 64])
+        self.buffer = bytes(data[full:])
+        return self
+
+    def copy(self):
+        state = SM3State.__new__(SM3State)
+        state.v = self.v
+        state.buffer = self.buffer
+        state.length = self.length
+        return state
+
+    def digest(self):
+        """返回32字节摘要，不改变当前状态"""
+        tail = self.buffer + _padding(self.length)
+        v = self.v
+        for i in range(0, len(tail), 64):
+            v = compress(v, tail[i:i + 64])
+        return _DIGEST.pack(*v)
+
+    def digest_int(self):
+        return int.from_bytes(self.digest(), 'big')
+
+    def hexdigest(self):
+        return self.digest().hex()
+
+
+def sm3_hash(data):
+    """计算 bytes 类对象的SM3摘要，返回32字节"""
+    return SM3State(data).digest()
+
+
+def _rotl_lanes(x, n):
+    """uint32 数组的循环左移"""
+    return (x << np.uint32(n)) | (x >> np.uint32(32 - n))
+
+
+def _compress_lanes(v, w16):
+    """多路并行压缩：v 形状为 (8, L)，w16 为 (16, L) 的消息字，每一列是一条独立的消息"""
+    rotl = _rotl_lanes
+    w = list(w16)
+    for j in range(16, 68):
+        x = w[j - 16] ^ w[j - 9] ^ rotl(w[j - 3], 15)
+        w.append(x ^ rotl(x, 15) ^ rotl(x, 23) ^ rotl(w[j - 13], 7) ^ w[j - 6])
+
+    a, b, c, d, e, f, g, h = v
+    for j in range(64):
+        a12 = rotl(a, 12)
+        ss1 = rotl(a12 + e + np.uint32(T_ROT[j]), 7)
+        if j < 16:
+            ff = a ^ b ^ c
+            gg = e ^ f ^ g
+        else:
+            ff = (a & b) | (a & c) | (b & c)
+            gg = (e & f) | (~e & g)
+        tt1 = ff + d + (ss1 ^ a12) + (w[j] ^ w[j + 4])      # uint32 加法自动按 2^32 取模
+        tt2 = gg + h + ss1 + w[j]
+        d = c
+        c = rotl(b, 9)
+        b = a
+        a = tt1
+        h = g
+        g = rotl(f, 19)
+        f = e
+        e = tt2 ^ rotl(tt2, 9) ^ rotl(tt2, 17)
+    return v ^ np.stack([a, b, c, d, e, f, g, h])
+
+
+def sm3_hash_batch(messages):
+    """批量计算多条消息的SM3摘要，返回与输入顺序一致的32字节摘要列表。
+    填充后分组数相同的消息组成一批，每条消息占一路，用NumPy按列并行压缩，适合大量短消息"""
+    messages = [bytes(m) for m in messages]
+    if np is None:
+        return [sm3_hash(m) for m in messages]
+    groups = {}
+    for index, message in enumerate(messages):
+        groups.setdefault((len(message) + 8) // 64 + 1, []).append(index)
+
+    digests = [None] * len(messages)
+    for block_count, indices in groups.items():
+        if len(indices) < MIN_LANES:
+            for i in indices:
+                digests[i] = sm3_hash(messages[i])
+            continue
+        padded = b''.join(messages[i] + _padding(len(messages[i])) for i in indices)
+        # (L, 分组数, 16) 的大端消息字，转置为 (分组数, 16, L)，每个分组的一个字是一行
+        words = np.frombuffer(padded, dtype='>u4').astype(np.uint32)
+        words = words.reshape(len(indices), block_count, 16).transpose(1, 2, 0)
+        v = np.repeat(np.array(IV, dtype=np.uint32)[:, None], len(indices), axis=1)
+        for block in words:
+            v = _compress_lanes(v, block)
+        raw = v.T.astype('>u4').tobytes()
+        for lane, i in enumerate(indices):
+            digests[i] = raw[lane * 32:(lane + 1) * 32]
+    return digests
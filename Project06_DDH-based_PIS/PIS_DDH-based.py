@@ -1,7 +1,19 @@
+import os
+import sys
 import hashlib
 import random
+import time
+import sqlite3
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from math import gcd
 
+try:
+    import numpy as np
+except ImportError:     # 没有 NumPy 时交集索引退化为 Python 集合
+    np = None
+
 # 群G的参数（素数阶群，示例用小参数）
 G_p = 23        # 群的模数（素数）
 G_q = 11        # 群的阶（素数，G_p-1必须是G_q的倍数，23-1=22=2×11）
@@ -11,16 +23,314 @@ G_g = 2         # 群的生成元，满足G_g^G_q ≡ 1 mod G_p
 paillier_p = 101  # 较大的素数
 paillier_q = 103  # 较大的素数（与群的阶不同，避免冲突）
 
+# 流式处理的参数
+CHUNK_SIZE = 4096           # 各轮每次处理、发送的元素个数
+INDEX_DIGEST_BYTES = 8      # 交集索引中每个双盲化值的摘要长度（字节）
+
+class ModPGroup:
+    """模p乘法群中的q阶子群，元素为整数，传输时编码为定长大端字节串"""
+    def __init__(self, p, q, g):
+        self.p = p
+        self.order = q
+        self.g = g
+        self.element_size = (p.bit_length() + 7) // 8
+
+    def hash_to_group(self, u):
+        """将标识符u映射到群中的元素"""
+        h_bytes = hashlib.sha256(u.encode()).digest()
+        h_int = int.from_bytes(h_bytes, 'big')
+        exponent = h_int % self.order  # 映射到群的指数范围
+        return pow(self.g, exponent, self.p)
+
+    def exp(self, x, k):
+        return pow(x, k, self.p)
+
+    def fixed_exponent(self, k):
+        # 内置 pow 已是C实现的滑动窗口模幂，Python层的指数重编码只会更慢
+        return ModPFixedExponent(self.p, k)
+
+    def encode(self, x):
+        return x.to_bytes(self.element_size, 'big')
+
+    def decode(self, data):
+        return int.from_bytes(data, 'big')
+
+    # H缓存中的存储格式，与传输编码相同
+    serialize = encode
+    deserialize = decode
+
+    @property
+    def cache_id(self):
+        return f"modp:{self.p:x}:{self.order:x}:{self.g:x}"
+
+
+class ModPFixedExponent:
+    """模p群中对许多底数计算同一指数的幂"""
+    def __init__(self, p, k):
+        self.p = p
+        self.k = k
+
+    def many(self, bases):
+        return [pow(x, self.k, self.p) for x in bases]
+
+
+def _load_sm2():
+    """从同仓库的 Project05_sm2 导入 SM2 类，复用其曲线参数与点运算"""
+    sm2_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'Project05_sm2')
+    if sm2_dir not in sys.path:
+        sys.path.insert(0, sm2_dir)
+    from sm2_02 import SM2
+    return SM2
+
+
+class ECGroup:
+    """素数阶椭圆曲线群，曲线参数与点运算复用 SM2 类（余因子为1，曲线上任意非无穷远点都在该群中）；
+    元素为仿射坐标点，传输时编码为33字节压缩点，每次盲化为一次256位标量乘法"""
+    def __init__(self, curve=None):
+        self.curve = curve or _load_sm2()
+        self.order = self.curve.N
+        self.element_size = 33
+
+    def hash_to_group(self, u):
+        """hash-to-curve（试探递增法）：x = SHA256(u || 计数器) mod q，
+        x³ + ax + b 为二次剩余时取y为偶数的点，否则计数器加一重试，平均约两次"""
+        u_bytes = u.encode()
+        counter = 0
+        while True:
+            digest = hashlib.sha256(u_bytes + counter.to_bytes(4, 'big')).digest()
+            x = int.from_bytes(digest, 'big') % self.curve.Q
+            try:
+                return self.curve.decompress_point(b'\x02' + x.to_bytes(32, 'big'))
+            except ValueError:
+                counter += 1
+
+    def exp(self, point, k):
+        # 指数为私钥，使用蒙哥马利梯子，运算次数与k无关
+        return self.curve.elliptic_mult(k, point)
+
+    def fixed_exponent(self, k):
+        return ECFixedExponent(self.curve, k)
+
+    def encode(self, point):
+        return self.curve.compress_point(point)
+
+    def decode(self, data):
+        return self.curve.decompress_point(data)
+
+    # H缓存中保存未压缩的 x || y，读取时无需开平方（缓存为本地可信数据，不再校验）
+    def serialize(self, point):
+        return point[0].to_bytes(32, 'big') + point[1].to_bytes(32, 'big')
+
+    def deserialize(self, data):
+        return (int.from_bytes(data[:32], 'big'), int.from_bytes(data[32:], 'big'))
+
+    @property
+    def cache_id(self):
+        return f"ec:{self.curve.Q:x}:{self.curve.G_X:x}"
+
+
+class ECFixedExponent:
+    """对许多点计算同一标量k的倍数：k只做一次正则有符号窗口重编码（各位均为非零奇数），
+    每个点只需约256次倍点和 256/w 次混合加法，运算序列与k的取值无关。
+    k为偶数时改用 k + n（n为奇数），结果相同"""
+    def __init__(self, curve, k, window=4):
+        self.curve = curve
+        self.window = window
+        k %= curve.N
+        if k == 0:
+            raise ValueError("指数不能为0")
+        if k % 2 == 0:
+            k += curve.N
+        count = -(-(curve.N.bit_length() + 1) // window)
+        self.digits = []
+        for _ in range(count - 1):
+            digit = (k & ((1 << (window + 1)) - 1)) - (1 << window)
+            self.digits.append(digit)
+            k = (k - digit) >> window
+        self.digits.append(k)       # 最高位为正奇数
+        self.digits.reverse()
+
+    def many(self, points):
+        """返回各点的k倍（仿射坐标）；各点的奇数倍表以及最终结果的归一化分别共用一次模逆"""
+        curve = self.curve
+        size = 1 << (self.window - 1)
+        tables = curve.normalize_jacobian([p for point in points for p in curve.odd_multiples(point, self.window + 1)])
+        results = []
+        for i in range(len(points)):
+            table = tables[i * size:(i + 1) * size]
+            acc = table[self.digits[0] >> 1]
+            for digit in self.digits[1:]:
+                for _ in range(self.window):
+                    acc = curve.jacobian_double(acc)
+                if digit > 0:
+                    acc = curve.jacobian_add(acc, table[digit >> 1])
+                else:
+                    acc = curve.jacobian_add(acc, curve.jacobian_neg(table[-digit >> 1]))
+            results.append(acc)
+        return [p[:2] for p in curve.normalize_jacobian(results)]
+
+
+# 默认使用示例参数的模p群；ECGroup() 为安全参数下的椭圆曲线群
+DEFAULT_GROUP = ModPGroup(G_p, G_q, G_g)
+
+
 def H(u):
-    """哈希函数，将标识符u映射到群G的元素"""
-    h_bytes = hashlib.sha256(u.encode()).digest()
-    h_int = int.from_bytes(h_bytes, 'big')
-    exponent = h_int % G_q  # 映射到群的指数范围
-    return pow(G_g, exponent, G_p)
+    """哈希函数，将标识符u映射到默认群G的元素"""
+    return DEFAULT_GROUP.hash_to_group(u)
+
+
+class HashCache:
+    """H(u) 的持久化缓存（SQLite）：键为 (群标识, 标识符)，值为群元素的存储格式。
+    记录每条的最近使用时间，本群条目超过 max_entries 时淘汰本群最久未使用的部分，
+    标识符集合变化不大时，每日重复运行协议可以跳过大部分 hash-to-group 计算。
+    各群的条目数保存在 h_cache_count 表中，与插入、删除在同一事务内更新，
+    多个进程共用同一数据库时也保持准确，写入时无需 COUNT(*) 全表扫描"""
+    QUERY_BATCH = 500       # 每条 SQL 查询携带的标识符个数，避免超过SQLite的参数上限
+
+    def __init__(self, path, group, max_entries=10_000_000):
+        self.group = group
+        self.group_id = group.cache_id
+        self.max_entries = max_entries
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS h_cache (grp TEXT, identifier TEXT, element BLOB, last_used REAL,"
+            " PRIMARY KEY (grp, identifier))")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS h_cache_grp_last_used ON h_cache (grp, last_used)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS h_cache_count (grp TEXT PRIMARY KEY, entries INTEGER)")
+        # 本群第一次使用该数据库时统计一次已有条目（只扫描本群的主键范围）
+        self._conn.execute(
+            "INSERT OR IGNORE INTO h_cache_count SELECT ?, COUNT(*) FROM h_cache WHERE grp = ?"
+            " AND NOT EXISTS (SELECT 1 FROM h_cache_count WHERE grp = ?)",
+            (self.group_id, self.group_id, self.group_id))
+        self._conn.commit()
+
+    def hash_many(self, identifiers):
+        """返回各标识符的 H(u)，缓存中没有的现场计算并写入。
+        先只读查询、在事务外完成 hash-to-group 计算，之后才在一个短事务内刷新命中条目的使用时间、
+        写入新条目并更新条目数，计算期间不持有写锁，不会阻塞共用数据库的其他进程"""
+        found = {}
+        for start in range(0, len(identifiers), self.QUERY_BATCH):
+            batch = identifiers[start:start + self.QUERY_BATCH]
+            placeholders = ','.join('?' * len(batch))
+            found.update(self._conn.execute(
+                f"SELECT identifier, element FROM h_cache WHERE grp = ? AND identifier IN ({placeholders})",
+                [self.group_id, *batch]).fetchall())
+        hits = list(found)
+
+        results = []
+        new_rows = []
+        now = time.time()
+        for u in identifiers:
+            if u in found:
+                results.append(self.group.deserialize(found[u]))
+            else:
+                element = self.group.hash_to_group(u)
+                found[u] = self.group.serialize(element)
+                new_rows.append((self.group_id, u, found[u], now))
+                results.append(element)
+
+        for start in range(0, len(hits), self.QUERY_BATCH):
+            batch = hits[start:start + self.QUERY_BATCH]
+            placeholders = ','.join('?' * len(batch))
+            self._conn.execute(
+                f"UPDATE h_cache SET last_used = ? WHERE grp = ? AND identifier IN ({placeholders})",
+                [now, self.group_id, *batch])
+        if new_rows:
+            # 其他进程可能已写入同一标识符，被忽略的行不计入条目数
+            added = self._conn.executemany("INSERT OR IGNORE INTO h_cache VALUES (?, ?, ?, ?)", new_rows).rowcount
+            entries = self._add_entries(added)
+            if entries > self.max_entries:
+                self._evict(entries)
+        self._conn.commit()
+        return results
+
+    def _add_entries(self, delta):
+        """在当前事务内更新本群条目数，返回更新后的值"""
+        self._conn.execute("UPDATE h_cache_count SET entries = entries + ? WHERE grp = ?", (delta, self.group_id))
+        return self._conn.execute("SELECT entries FROM h_cache_count WHERE grp = ?", (self.group_id,)).fetchone()[0]
+
+    def _evict(self, entries):
+        # 一次淘汰到上限的90%，避免每次写入都触发淘汰；只淘汰本群的条目
+        deleted = self._conn.execute(
+            "DELETE FROM h_cache WHERE rowid IN"
+            " (SELECT rowid FROM h_cache WHERE grp = ? ORDER BY last_used LIMIT ?)",
+            (self.group_id, entries - self.max_entries * 9 // 10)).rowcount
+        self._add_entries(-deleted)
+
+    def __len__(self):
+        """本群的条目数"""
+        return self._conn.execute("SELECT entries FROM h_cache_count WHERE grp = ?", (self.group_id,)).fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+
+class Blinder:
+    """一方的盲化运算：同一私钥指数的固定指数引擎，以及可选的H缓存"""
+    def __init__(self, group, exponent, h_cache=None):
+        self.group = group
+        self.power = group.fixed_exponent(exponent)
+        self.h_cache = h_cache
+
+    def blind_identifiers(self, identifiers):
+        """H(u)^k 的编码"""
+        if self.h_cache is not None:
+            hashed = self.h_cache.hash_many(identifiers)
+        else:
+            hashed = [self.group.hash_to_group(u) for u in identifiers]
+        return [self.group.encode(x) for x in self.power.many(hashed)]
+
+    def blind_elements(self, elements):
+        """s^k，输入输出均为元素编码"""
+        decoded = [self.group.decode(s) for s in elements]
+        return [self.group.encode(x) for x in self.power.many(decoded)]
+
+
+class RandomnessPool:
+    """预计算的 r^n mod n² 池：加密和刷新时直接取用，后台线程在池中数量低于 low 时补充到 size；
+    池空时现场计算，不会阻塞。
+    注意 pow 计算期间持有GIL，补充线程与调用方分时共用同一个核，并非真正离线：
+    只有调用方在等待I/O（如网络收发）或空闲时，预计算才能“免费”完成；CPU密集的调用方会被拖慢"""
+    def __init__(self, compute, size=1024, low=None):
+        self._compute = compute
+        self.size = size
+        self.low = size // 2 if low is None else low
+        self._items = deque()
+        self._refill = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._refill.set()
+
+    def _run(self):
+        while True:
+            self._refill.wait()
+            self._refill.clear()
+            if self._stop.is_set():
+                return
+            while len(self._items) < self.size and not self._stop.is_set():
+                self._items.append(self._compute())
+
+    def get(self):
+        try:
+            value = self._items.popleft()
+        except IndexError:
+            value = self._compute()
+        if len(self._items) < self.low:
+            self._refill.set()
+        return value
+
+    def __len__(self):
+        return len(self._items)
+
+    def close(self):
+        self._stop.set()
+        self._refill.set()
+        self._thread.join()
 
 
 class Paillier:
-    def __init__(self, p=None, q=None, n=None, g=None):
+    def __init__(self, p=None, q=None, n=None, g=None, pool_size=0):
         if p and q:
             # 解密方：需知道p和q，生成完整密钥（含私钥参数lam、mu）
             self.n = p * q
@@ -28,45 +338,324 @@ class Paillier:
             self.lam = lam
             self.g = self.n + 1                   # 公钥g = n+1（标准Paillier选择）
             self.mu = pow(lam, -1, self.n)        # μ = λ⁻¹ mod n
+            # CRT解密与r^n计算所需的参数：分别在模p²、q²下计算，再用中国剩余定理合并
+            self.p, self.q = p, q
+            self.p_sq, self.q_sq = p * p, q * q
+            self.hp = pow(self._L(pow(self.g, p - 1, self.p_sq), p), -1, p)
+            self.hq = pow(self._L(pow(self.g, q - 1, self.q_sq), q), -1, q)
+            self.q_inv_p = pow(q, -1, p)
+            self.q_sq_inv_p_sq = pow(self.q_sq, -1, self.p_sq)
         elif n and g:
             # 加密方：仅需公钥n和g，无法解密
             self.n = n
             self.g = g
         else:
             raise ValueError("需提供 (p,q) 作为解密方，或 (n,g) 作为加密方.")
+        self.n_sq = self.n * self.n
+        # 预计算的随机数池，pool_size为0时不启用
+        self.pool = RandomnessPool(self._random_factor, pool_size) if pool_size > 0 else None
+
+    @staticmethod
+    def _L(x, n):
+        return (x - 1) // n
+
+    def _r_pow_n(self, r):
+        """计算r^n mod n²；解密方知道p、q，分别在模p²、q²下计算后合并"""
+        if not hasattr(self, 'p'):
+            return pow(r, self.n, self.n_sq)
+        rp = pow(r, self.n, self.p_sq)
+        rq = pow(r, self.n, self.q_sq)
+        return rq + self.q_sq * ((rp - rq) * self.q_sq_inv_p_sq % self.p_sq)
+
+    def _random_factor(self):
+        """随机选取与n互素的r并返回r^n mod n²（r与n不互素时密文无法正确解密）"""
+        while True:
+            r = random.randint(1, self.n-1)
+            if gcd(r, self.n) == 1:
+                return self._r_pow_n(r)
+
+    def _next_random_factor(self):
+        return self.pool.get() if self.pool is not None else self._random_factor()
 
     def encrypt(self, m, r=None):
         """加密（仅加密方可用，无需私钥）"""
         if m < 0 or m >= self.n:
             raise ValueError(f"明文必须满足 0 ≤ m < {self.n}，但输入为 {m}")
-        n_sq = self.n * self.n
-        if r is None:
-            r = random.randint(1, self.n-1)
-        c = (pow(self.g, m, n_sq) * pow(r, self.n, n_sq)) % n_sq
-        return c
+        n_sq = self.n_sq
+        # g = n+1 时 g^m = (1+n)^m ≡ 1 + m·n (mod n²)，省去一次模幂
+        g_m = (1 + m * self.n) % n_sq if self.g == self.n + 1 else pow(self.g, m, n_sq)
+        r_n = self._next_random_factor() if r is None else self._r_pow_n(r)
+        return g_m * r_n % n_sq
+
+    def encrypt_many(self, messages):
+        """批量加密，随机因子优先从预计算池中取用"""
+        return [self.encrypt(m) for m in messages]
 
     def decrypt(self, c):
-        """解密（仅解密方可调用，需私钥参数lam、mu）"""
+        """解密（仅解密方可调用，需私钥参数）：分别在模p²、q²下求幂，再用中国剩余定理合并"""
         if not hasattr(self, 'lam') or not hasattr(self, 'mu'):
             raise PermissionError("加密方无法解密，需解密方私钥.")
-        n_sq = self.n * self.n
-        c_lam = pow(c, self.lam, n_sq)
-        l = (c_lam - 1) // self.n
-        m = (l * self.mu) % self.n
-        return m
+        p, q = self.p, self.q
+        mp = self._L(pow(c, p - 1, self.p_sq), p) * self.hp % p
+        mq = self._L(pow(c, q - 1, self.q_sq), q) * self.hq % q
+        return mq + q * ((mp - mq) * self.q_inv_p % p)
 
     def add(self, c1, c2):
         """同态加法（加密方、解密方均可用）"""
-        n_sq = self.n * self.n
-        return (c1 * c2) % n_sq
+        return (c1 * c2) % self.n_sq
+
+    def sum_many(self, ciphertexts, initial=None):
+        """同态求和：返回各密文对应明文之和的密文；initial为空时从加密0开始"""
+        n_sq = self.n_sq
+        total = self.encrypt(0) if initial is None else initial
+        for c in ciphertexts:
+            total = total * c % n_sq
+        return total
 
     def refresh(self, c):
         """密文刷新（加密方可用，随机化密文）"""
-        n_sq = self.n * self.n
-        r = random.randint(1, self.n-1)
-        return (c * pow(r, self.n, n_sq)) % n_sq
+        return (c * self._next_random_factor()) % self.n_sq
+
+    def close(self):
+        """停止预计算池的后台线程"""
+        if self.pool is not None:
+            self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
 
-def simulate_protocol():
+def iter_chunks(items, chunk_size=CHUNK_SIZE):
+    """将任意可迭代对象按 chunk_size 切分为列表，整个集合不需要同时放在内存中"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def element_digest(data):
+    """群元素编码的定长摘要，用作交集索引的键；摘要相同的不同元素会被误判为交集，
+    8字节摘要在千万级集合上的误判概率约为 |Z|·|T| / 2^64"""
+    return int.from_bytes(hashlib.blake2b(data, digest_size=INDEX_DIGEST_BYTES).digest(), 'big')
+
+
+class BlindedIndex:
+    """双盲化值 Z（群元素的编码）的哈希索引：只保存定长摘要。
+    有 NumPy 时为排序后的 uint64 数组（每个元素8字节），按块二分查找；否则为摘要集合"""
+    def __init__(self):
+        self._chunks = []
+        self._digests = None
+
+    def add_many(self, values):
+        digests = [element_digest(v) for v in values]
+        if np is not None:
+            self._chunks.append(np.array(digests, dtype=np.uint64))
+        else:
+            self._chunks.append(digests)
+
+    def freeze(self):
+        """全部值加入后调用一次，合并并排序"""
+        if np is not None:
+            self._digests = np.unique(np.concatenate(self._chunks)) if self._chunks else np.empty(0, dtype=np.uint64)
+        else:
+            self._digests = set()
+            for chunk in self._chunks:
+                self._digests.update(chunk)
+        self._chunks = []
+        return self
+
+    def contains_many(self, values):
+        """逐个判断 values 是否在索引中，返回布尔值列表"""
+        digests = [element_digest(v) for v in values]
+        if np is None:
+            return [d in self._digests for d in digests]
+        if len(self._digests) == 0:
+            return [False] * len(digests)
+        digests = np.array(digests, dtype=np.uint64)
+        positions = np.searchsorted(self._digests, digests)
+        positions[positions == len(self._digests)] = 0
+        return (self._digests[positions] == digests).tolist()
+
+    def __len__(self):
+        return len(self._digests)
+
+
+# 协议各轮均为流式阶段：输入、输出都是按块产出的迭代器，每块在块内打乱顺序；
+# 在双方之间传递的群元素均为 group.encode 的编码
+
+def round1(P1_V, k1, group=DEFAULT_GROUP, chunk_size=CHUNK_SIZE, h_cache=None):
+    """Round 1（P1 → P2）：逐块产出 H(v)^k1"""
+    blinder = Blinder(group, k1, h_cache)
+    for chunk in iter_chunks(P1_V, chunk_size):
+        S1 = blinder.blind_identifiers(chunk)
+        random.shuffle(S1)
+        yield S1
+
+
+def shuffle_all(items):
+    """整体随机置换：先收齐全部元素再打乱一次。
+    只在块内打乱时，收到的块与发出的块一一对应，接收方可据此把交集定位到块（块大小为1时精确到元素）"""
+    items = list(items)
+    random.shuffle(items)
+    return items
+
+
+def round2_Z(S1_chunks, k2, group=DEFAULT_GROUP, chunk_size=CHUNK_SIZE):
+    """Round 2（P2 → P1）：收齐 S1 后整体打乱，再逐块产出 s^k2。
+    P1 知道自己发出的每块 S1 由哪些标识符生成，Z 必须与 S1 的分块顺序无关；
+    P2 需缓存全部 S1（每个元素 group.element_size 字节）"""
+    blinder = Blinder(group, k2)
+    S1 = shuffle_all(s for chunk in S1_chunks for s in chunk)
+    for chunk in iter_chunks(S1, chunk_size):
+        yield blinder.blind_elements(chunk)
+
+
+def round2_T(P2_W, k2, paillier, group=DEFAULT_GROUP, chunk_size=CHUNK_SIZE, h_cache=None):
+    """Round 2（P2 → P1）：逐块产出 (H(w)^k2, Enc(t))。
+    先整体打乱 P2_W 再分块，P1 按块统计的交集个数与 P2 输入中的位置无关；
+    打乱输入与打乱输出等价，且无需缓存体积更大的密文"""
+    blinder = Blinder(group, k2, h_cache)
+    for chunk in iter_chunks(shuffle_all(P2_W), chunk_size):
+        encrypted = paillier.encrypt_many([t for _, t in chunk])
+        yield list(zip(blinder.blind_identifiers([w for w, _ in chunk]), encrypted))
+
+
+def build_index(Z_chunks):
+    """P1 将收到的 Z 逐块加入哈希索引"""
+    index = BlindedIndex()
+    for Z in Z_chunks:
+        index.add_many(Z)
+    return index.freeze()
+
+
+def round3(T_chunks, k1, index, paillier, group=DEFAULT_GROUP):
+    """Round 3（P1 → P2）：逐块计算 H(w)^(k1·k2)，在索引中查找交集并同态累加，最后刷新密文"""
+    blinder = Blinder(group, k1)
+    sum_e = paillier.encrypt(0)  # 初始化为加密0
+    # 注意：直接比较 h_w_k1k2 是否在 Z 中存在安全风险，
+    # 实际应用中应使用零知识证明技术避免信息泄露
+    for T in T_chunks:
+        h_w_k1k2 = blinder.blind_elements([h_w_k2 for h_w_k2, _ in T])
+        matched = index.contains_many(h_w_k1k2)
+        sum_e = paillier.sum_many((e_t for (_, e_t), hit in zip(T, matched) if hit), sum_e)
+
+    # 刷新密文，增加随机性，防止通过密文模式推断明文
+    return paillier.refresh(sum_e)
+
+
+# 并行执行：每个工作进程在初始化时接收一次群参数、私钥指数和Paillier公钥（或私钥），
+# 固定指数引擎和H缓存连接也只在初始化时创建，之后每个任务只传递一块数据
+_round_worker = None
+
+
+def _init_round_worker(group, exponent, paillier_key, h_cache_path):
+    global _round_worker
+    paillier = None
+    if paillier_key is not None:
+        p, q, n, g = paillier_key
+        paillier = Paillier(p, q) if p and q else Paillier(n=n, g=g)
+    h_cache = HashCache(h_cache_path, group) if h_cache_path else None
+    _round_worker = (Blinder(group, exponent, h_cache), paillier)
+
+
+def _blind_identifiers(identifiers):
+    """H(v)^k"""
+    return _round_worker[0].blind_identifiers(identifiers)
+
+
+def _blind_elements(elements):
+    """s^k，输入输出均为元素编码"""
+    return _round_worker[0].blind_elements(elements)
+
+
+def _blind_records(records):
+    """(H(w)^k, Enc(t))"""
+    blinder, paillier = _round_worker
+    encrypted = paillier.encrypt_many([t for _, t in records])
+    return list(zip(blinder.blind_identifiers([w for w, _ in records]), encrypted))
+
+
+class ParallelRoundExecutor:
+    """多进程执行协议各轮：输入按块分发到进程池，结果按原顺序取回。
+    Round 1 在块内打乱；P2 的两轮与串行版本相同，在分块前整体打乱（见 shuffle_all）。
+    每一方各自创建一个执行器，私钥指数只发送给本方的工作进程；
+    在途任务数不超过 max_pending，除 P2 缓存的 S1 与 P2_W 外，内存占用与集合大小无关"""
+    def __init__(self, exponent, group=DEFAULT_GROUP, paillier=None, workers=None,
+                 chunk_size=CHUNK_SIZE, max_pending=None, h_cache_path=None):
+        self.group = group
+        self.exponent = exponent
+        self.chunk_size = chunk_size
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 2
+        paillier_key = None
+        if paillier is not None:
+            paillier_key = (getattr(paillier, 'p', None), getattr(paillier, 'q', None), paillier.n, paillier.g)
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_round_worker,
+                                         initargs=(group, exponent, paillier_key, h_cache_path))
+
+    def close(self):
+        self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _map(self, func, chunks):
+        """按顺序产出 func(chunk) 的结果，同时最多 max_pending 个块在途"""
+        pending = deque()
+        for chunk in chunks:
+            if len(pending) >= self.max_pending:
+                yield pending.popleft().result()
+            pending.append(self._pool.submit(func, chunk))
+        while pending:
+            yield pending.popleft().result()
+
+    def _shuffled(self, func, chunks):
+        for result in self._map(func, chunks):
+            random.shuffle(result)
+            yield result
+
+    def round1(self, P1_V):
+        """Round 1（P1）：H(v)^k1"""
+        return self._shuffled(_blind_identifiers, iter_chunks(P1_V, self.chunk_size))
+
+    def round2_Z(self, S1_chunks):
+        """Round 2（P2）：s^k2，与 round2_Z 相同，收齐 S1 后整体打乱再分块"""
+        S1 = shuffle_all(s for chunk in S1_chunks for s in chunk)
+        return self._map(_blind_elements, iter_chunks(S1, self.chunk_size))
+
+    def round2_T(self, P2_W):
+        """Round 2（P2）：(H(w)^k2, Enc(t))，整体打乱 P2_W 后分块；执行器需以P2的Paillier密钥创建"""
+        return self._map(_blind_records, iter_chunks(shuffle_all(P2_W), self.chunk_size))
+
+    def round3(self, T_chunks, index, paillier):
+        """Round 3（P1）：工作进程计算 H(w)^(k1·k2)，主进程查找交集并同态累加，最后刷新密文"""
+        T_chunks = iter(T_chunks)
+        buffered = deque()
+
+        def blinded_chunks():
+            for T in T_chunks:
+                buffered.append(T)
+                yield [h_w_k2 for h_w_k2, _ in T]
+
+        sum_e = paillier.encrypt(0)
+        for h_w_k1k2 in self._map(_blind_elements, blinded_chunks()):
+            T = buffered.popleft()
+            matched = index.contains_many(h_w_k1k2)
+            sum_e = paillier.sum_many((e_t for (_, e_t), hit in zip(T, matched) if hit), sum_e)
+        return paillier.refresh(sum_e)
+
+
+def simulate_protocol(group=DEFAULT_GROUP, workers=0):
     # -----------------------
     # 模拟双方输入
     # -----------------------
@@ -77,68 +666,45 @@ def simulate_protocol():
     # Setup阶段
     # -----------------------
     # P1选择私钥k1
-    k1 = random.randint(1, G_q-1)  # k1 ∈ [1, G_q-1]
+    k1 = random.randint(1, group.order-1)  # k1 ∈ [1, q-1]
 
     # P2选择私钥k2，并生成Paillier密钥对
-    k2 = random.randint(1, G_q-1)  # k2 ∈ [1, G_q-1]
-    p2_paillier = Paillier(paillier_p, paillier_q)
-    pk = (p2_paillier.n, p2_paillier.g)  # 公钥发送给P1
-    print(f"Paillier公钥: n={pk[0]}, g={pk[1]}")
-
-    # -----------------------
-    # Round 1: P1 → P2
-    # -----------------------
-    S1 = []
-    for v in P1_V:
-        h = H(v)
-        s = pow(h, k1, G_p)
-        S1.append(s)
-    random.shuffle(S1)  # 打乱顺序
+    k2 = random.randint(1, group.order-1)  # k2 ∈ [1, q-1]
+    # P2 为每条记录加密，启用预计算池；with 保证出错时也会停止池的后台线程
+    with Paillier(paillier_p, paillier_q, pool_size=256) as p2_paillier:
+        pk = (p2_paillier.n, p2_paillier.g)  # 公钥发送给P1
+        print(f"Paillier公钥: n={pk[0]}, g={pk[1]}")
 
-    # -----------------------
-    # Round 2: P2 → P1
-    # -----------------------
-    # 处理S1生成Z
-    Z = []
-    for s in S1:
-        z = pow(s, k2, G_p)
-        Z.append(z)
-    random.shuffle(Z)  # 打乱顺序
-
-    # 处理W生成T
-    T = []
-    for (w, t) in P2_W:
-        h_w = H(w)
-        h_w_k2 = pow(h_w, k2, G_p)
-        e_t = p2_paillier.encrypt(t)
-        T.append( (h_w_k2, e_t) )
-    random.shuffle(T)  # 打乱顺序
+        # -----------------------
+        # Round 1 / Round 2 / Round 3：各轮按块流式衔接
+        # -----------------------
+        # P1 作为加密方，仅用公钥 (n, g) 初始化 Paillier
+        p1_paillier = Paillier(n=pk[0], g=pk[1])  # 不再传入p和q
 
-    # -----------------------
-    # Round 3: P1 → P2
-    # -----------------------
-    # P1 作为加密方，仅用公钥 (n, g) 初始化 Paillier
-    p1_paillier = Paillier(n=pk[0], g=pk[1])  # 不再传入p和q
+        if workers > 0:
+            # 双方各用一个进程池并行执行本方的各轮计算
+            with ParallelRoundExecutor(k1, group, workers=workers) as p1_executor, \
+                    ParallelRoundExecutor(k2, group, p2_paillier, workers=workers) as p2_executor:
+                index = build_index(p2_executor.round2_Z(p1_executor.round1(P1_V)))
+                sum_e_refreshed = p1_executor.round3(p2_executor.round2_T(P2_W), index, p1_paillier)
+        else:
+            # P1 → P2 → P1：S1 逐块发给P2，P2 返回的 Z 逐块加入P1的哈希索引
+            index = build_index(round2_Z(round1(P1_V, k1, group), k2, group))
 
-    # 寻找交集并计算同态和
-    sum_e = p1_paillier.encrypt(0)  # 初始化为加密0
-    # 注意：直接比较 h_w_k1k2 in Z 存在安全风险，
-    # 实际应用中应使用零知识证明技术避免信息泄露
-    for (h_w_k2, e_t) in T:
-        h_w_k1k2 = pow(h_w_k2, k1, G_p)
-        if h_w_k1k2 in Z:
-            sum_e = p1_paillier.add(sum_e, e_t)
-    
-    # 刷新密文，增加随机性，防止通过密文模式推断明文
-    sum_e_refreshed = p1_paillier.refresh(sum_e)
+            # P2 → P1 → P2：T 逐块发给P1，P1 查找交集并同态累加
+            sum_e_refreshed = round3(round2_T(P2_W, k2, p2_paillier, group), k1, index, p1_paillier, group)
 
-    # -----------------------
-    # Output: P2解密
-    # -----------------------
-    s_J = p2_paillier.decrypt(sum_e_refreshed)
-    print("交集元素:", [v for v in P1_V if v in [w for w, _ in P2_W]])
-    print("交集元素对应数值和:", sum(t for w, t in P2_W if w in P1_V))
-    print("解密结果:", s_J)
+        # -----------------------
+        # Output: P2解密
+        # -----------------------
+        s_J = p2_paillier.decrypt(sum_e_refreshed)
+        print("交集元素:", [v for v in P1_V if v in [w for w, _ in P2_W]])
+        print("交集元素对应数值和:", sum(t for w, t in P2_W if w in P1_V))
+        print("解密结果:", s_J)
 
 if __name__ == "__main__":
-    simulate_protocol()
\ No newline at end of file
+    simulate_protocol()
+    print("--- 椭圆曲线群 ---")
+    simulate_protocol(ECGroup())
+    print("--- 椭圆曲线群，多进程 ---")
+    simulate_protocol(ECGroup(), workers=2)
\ No newline at end of file